@@ -1,10 +1,128 @@
+import asyncio
+import base64
+import bisect
+import concurrent.futures
+import contextlib
+import copy
+import fcntl
+import functools
 import motor.motor_tornado
 import multiprocessing as mp
+import os
 import pickle
 import pymongo
 import json
+import sqlite3
+import threading
+import time
 
 import env
+import stats
+
+
+# types of the fields used to sort the collections
+ORDER_TYPES = {
+	'date_created': (int, float),
+	'utcTime': (str,)
+}
+
+def encode_cursor(doc, order_key):
+	# encode the sort key of the last document of a page as an opaque token
+	data = json.dumps([doc[order_key], doc['_id']])
+	return base64.urlsafe_b64encode(data.encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor, order_key):
+	# decode a token created by encode_cursor() into the tuple (order value, id),
+	# making sure it was created for a collection sorted by the same key
+	try:
+		value, id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+	except (ValueError, TypeError):
+		raise ValueError('Invalid cursor')
+
+	if isinstance(value, bool) or not isinstance(value, ORDER_TYPES[order_key]) or not isinstance(id, str):
+		raise ValueError('Invalid cursor')
+
+	return (value, id)
+
+def project(doc, fields):
+	# keep only the given fields of a document and its id, where 'a.b' selects the
+	# field b of the subdocument a, or of each subdocument of a list a, as Mongo does
+	if fields == None:
+		return doc
+
+	result = {'_id': doc['_id']} if '_id' in doc else {}
+	for field in fields:
+		_project_field(doc, field.split('.'), result)
+
+	return result
+
+def _project_field(src, path, dst):
+	key, rest = path[0], path[1:]
+	if key not in src:
+		return
+
+	value = src[key]
+	if not rest:
+		dst[key] = value
+	elif isinstance(value, dict):
+		_project_field(value, rest, dst.setdefault(key, {}))
+	elif isinstance(value, list):
+		items = [v for v in value if isinstance(v, dict)]
+		for v, d in zip(items, dst.setdefault(key, [{} for _ in items])):
+			_project_field(v, rest, d)
+
+def modify(doc, update):
+	# apply the $set, $inc, $push and $pull operators of a Mongo update to a document
+	# in place, where 'a.0.b' is the field b of the first item of the list a
+	for path, value in update.get('$set', {}).items():
+		parent, key = _modify_path(doc, path)
+		parent[key] = value
+
+	for path, value in update.get('$inc', {}).items():
+		parent, key = _modify_path(doc, path)
+		parent[key] = parent.get(key, 0) + value
+
+	for path, value in update.get('$push', {}).items():
+		parent, key = _modify_path(doc, path)
+		parent[key].append(value)
+
+	# $pull removes the items of a list whose fields have the given values
+	for path, condition in update.get('$pull', {}).items():
+		parent, key = _modify_path(doc, path)
+		parent[key] = [v for v in parent[key] if not (isinstance(v, dict) and all(v.get(k) == c for k, c in condition.items()))]
+
+def _modify_path(doc, path):
+	keys = [int(k) if k.isdigit() else k for k in path.split('.')]
+	for key in keys[:-1]:
+		doc = doc[key]
+
+	return doc, keys[-1]
+
+def task_pipeline(task):
+	# return the pipeline of a 'started' event, or None if the event doesn't name it
+	return _task_name(task, ['metadata', 'workflow', 'projectName'])
+
+def task_process(task):
+	# return the process of a 'process_*' event, or None if the event doesn't name it
+	return _task_name(task, ['trace', 'process'])
+
+def _task_name(task, keys):
+	for key in keys:
+		if not isinstance(task, dict):
+			return None
+		task = task.get(key)
+
+	return task if isinstance(task, str) else None
+
+def max_time(a, b):
+	# return the latest of two event times, either of which may be missing
+	return max(a, b) if a != None and b != None else a if b == None else b
+
+def process_stats_update(entry):
+	# express the catalogue entry of a process, with its last event time and the resource
+	# statistics of its completed tasks, as a pipeline update of its mongo document
+	return stats.mongo_update(entry['metrics']) + [{ '$set': { 'last_seen': { '$max': ['$last_seen', entry['last_seen']] } } }]
+
 
 
 class Backend():
@@ -14,15 +132,24 @@ class Backend():
 	def initialize(self):
 		pass
 
+	async def startup(self):
+		pass
+
+	def close(self):
+		pass
+
+	async def index_report(self):
+		raise NotImplementedError()
+
 
 	# user functions -----
-	async def user_query(self, page, page_size):
+	async def user_query(self, page, page_size, cursor=None, fields=None):
 		raise NotImplementedError()
 
 	async def user_create(self, user):
 		raise NotImplementedError()
 
-	async def user_get(self, username):
+	async def user_get(self, username, fields=None):
 		raise NotImplementedError()
 
 	async def user_update(self, id, user):
@@ -32,13 +159,13 @@ class Backend():
 		raise NotImplementedError()
 
 	# dataset functions -----
-	async def dataset_query(self, page, page_size):
+	async def dataset_query(self, user_id, page, page_size, cursor=None, fields=None):
 		raise NotImplementedError()
 
 	async def dataset_create(self, data):
 		raise NotImplementedError()
 
-	async def dataset_get(self, id):
+	async def dataset_get(self, id, fields=None):
 		raise NotImplementedError()
 
 	async def dataset_update(self, id, dataset):
@@ -48,18 +175,27 @@ class Backend():
 		raise NotImplementedError()
 
 	# workflow functions -----
-	async def workflow_query(self, page, page_size):
+	async def workflow_query(self, user_id, page, page_size, cursor=None, fields=None):
 		raise NotImplementedError()
 
 	async def workflow_create(self, workflow):
 		raise NotImplementedError()
 
-	async def workflow_get(self, id):
+	async def workflow_get(self, id, fields=None):
 		raise NotImplementedError()
 
 	async def workflow_update(self, id, workflow):
 		raise NotImplementedError()
 
+	async def workflow_set_fields(self, id, fields):
+		raise NotImplementedError()
+
+	async def attempt_create(self, id, attempt, fields={}):
+		raise NotImplementedError()
+
+	async def attempt_set_fields(self, id, n_attempt, fields, workflow_fields={}):
+		raise NotImplementedError()
+
 	async def workflow_delete(self, id):
 		raise NotImplementedError()
 	
@@ -67,13 +203,28 @@ class Backend():
 		raise NotImplementedError()
 
 	# task functions -----
-	async def task_query(self, page, page_size):
+	async def task_query(self, page, page_size, cursor=None, fields=None):
 		raise NotImplementedError()
 
 	async def task_create(self, task):
 		raise NotImplementedError()
 
-	async def task_get(self, id):
+	async def task_create_many(self, tasks):
+		raise NotImplementedError()
+
+	async def task_query_pipelines(self, details=False):
+		raise NotImplementedError()
+
+	async def task_query_pipeline(self, pipeline):
+		raise NotImplementedError()
+
+	async def task_query_stats(self, pipeline):
+		raise NotImplementedError()
+
+	def task_iter_pipeline(self, pipeline, process=None, by_process=False):
+		raise NotImplementedError()
+
+	async def task_get(self, id, fields=None):
 		raise NotImplementedError()
 
 
@@ -81,87 +232,728 @@ class Backend():
 
 # /*
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-# 	FILE BACKEND
+# 	FILE LOCK
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-#		Class that saves the dataset, workflows and tasks information into a file
+#		Write lock shared by all the processes that open the same lock file,
+#		which also stores the number of writes made under the lock
 # ----------------------------------------------------------------------------------------
 # */
 
-class FileBackend(Backend):
+class FileLock():
 
 	def __init__(self, url):
-		self._lock = mp.Lock()
 		self._url = url
-		self.initialize()
+		self._pid = None
 
-	def initialize(self, error_not_found=False):
-		# load database from pickle file
+	def _fd(self):
+		# reopen the lock file after a fork, since flock() locks are shared
+		# by every process that inherits the same open file
+		if self._pid != os.getpid():
+			self._file = os.open(self._url, os.O_RDWR | os.O_CREAT, 0o644)
+			self._pid = os.getpid()
+
+		return self._file
+
+	@contextlib.contextmanager
+	def _locked(self, operation):
+		fd = self._fd()
+		fcntl.flock(fd, operation)
 		try:
-			self.load()
+			yield
+		finally:
+			fcntl.flock(fd, fcntl.LOCK_UN)
+
+	def exclusive(self):
+		# writers wait for each other, readers don't take the lock since the
+		# files are replaced atomically
+		return self._locked(fcntl.LOCK_EX)
+
+	def generation(self):
+		# read the write counter from the beginning of the lock file
+		data = os.pread(self._fd(), 8, 0)
+		return int.from_bytes(data, 'little') if len(data) == 8 else 0
+
+	def increment(self):
+		# must be called while holding the exclusive lock
+		os.pwrite(self._fd(), (self.generation() + 1).to_bytes(8, 'little'), 0)
+
+
 
-		# initialize empty database if pickle file doesn't exist
-		except FileNotFoundError:
-			self._db = {
-				'users': [],
-				'datasets': [],
-				'workflows': [],
-				'tasks': []
-			}
-			self.save()
+
+# /*
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# 	FILE COLLECTION
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#		Class that keeps the documents of a collection in memory and saves them into a file
+# ----------------------------------------------------------------------------------------
+# */
+
+class FileCollection():
+
+	# attempts to read a snapshot and journal of the same generation while another process compacts them
+	REFRESH_ATTEMPTS = 100
+
+	def __init__(self, name, url, order_key, hash_keys=[], user_index=False, journal=False, compact_every=10000):
+		self.name = name
+		self._url = url
+		self._journal_url = '%s.journal' % (url)
+		self._lock = FileLock('%s.lock' % (url))
+		self._order_key = order_key
+		self._hash_keys = hash_keys
+		self._user_index = user_index
+		self._journal = journal
+		self._compact_every = compact_every
+
+		# held while the documents in memory are refreshed, read or changed, so the
+		# readers and the writer of a process can run on different threads
+		self._memory = threading.RLock()
+
+	def initialize(self, legacy_url=None):
+		with self._lock.exclusive():
+			# create the collection file, taking the documents from the single
+			# database file of previous versions if it exists
+			if not os.path.exists(self._url):
+				try:
+					docs = pickle.load(open(legacy_url, 'rb')).get(self.name, [])
+				except (FileNotFoundError, TypeError):
+					docs = []
+
+				self.docs = {d['_id']: d for d in docs}
+				self._generation = 0
+				self.save()
+
+			self._generation = self._snapshot_generation()
+			journal_generation = self._journal_generation()
+
+			# start the journal of the snapshot if it doesn't exist, or if it was left
+			# behind by a compaction interrupted after writing the snapshot
+			if self._journal:
+				if journal_generation != self._generation:
+					self._journal_reset()
+
+			# without journal fold the journal of a previous run into the snapshot
+			elif journal_generation != None:
+				if journal_generation == self._generation:
+					self._loaded = False
+					self._replay()
+					self.save()
+				os.remove(self._journal_url)
+
+		# the documents are loaded the first time the collection is used
+		self._loaded = False
 
 	def load(self):
-		self._db = pickle.load(open(self._url, 'rb'))
+		# keep the documents in memory as a dictionary indexed by id
+		with open(self._url, 'rb') as f:
+			self._generation, docs = self._read_snapshot(f)
+
+		self.docs = {d['_id']: d for d in docs}
+		self._index()
+		self._loaded = True
+
+	def save(self, docs=None):
+		# write the snapshot into a temporary file and rename it, so that
+		# readers and crashes only ever see a complete snapshot
+		self._write_atomic(self._url, [self._generation, list(self.docs.values()) if docs == None else docs])
+
+	def refresh(self):
+		# without journal the collection file is the only copy of the documents,
+		# reload it only if another process or a previous write changed it
+		if not self._journal:
+			signature = self._signature()
+			if not self._loaded or signature != self._loaded_signature:
+				self.load()
+				self._loaded_signature = signature
+			return
+
+		# retry while another process is between writing the snapshot and the journal of a compaction
+		for _ in range(self.REFRESH_ATTEMPTS):
+			if self._replay():
+				return
+			time.sleep(0.01)
+
+		raise RuntimeError('Journal of collection \"%s\" does not match its snapshot' % self.name)
+
+	def compact(self, docs):
+		# write the documents as the snapshot of a new generation, then start its journal; the
+		# readers of this process that see the new journal meanwhile reload the new snapshot
+		generation = self._generation + 1
+		self._write_atomic(self._url, [generation, docs])
+		self._write_atomic(self._journal_url, [generation])
+
+		stat = os.stat(self._journal_url)
+		with self._memory:
+			self._generation = generation
+			self._journal_inode = stat.st_ino
+			self._journal_offset = stat.st_size
+			self._journal_count = 0
+
+	def _replay(self):
+		with open(self._journal_url, 'rb') as f:
+			inode = os.fstat(f.fileno()).st_ino
+
+			# reload the snapshot on first use or if the journal was compacted by another process
+			if not self._loaded or inode != self._journal_inode:
+				generation = pickle.load(f)
+				self.load()
+
+				# the snapshot and the journal must belong to the same generation
+				if generation != self._generation:
+					self._loaded = False
+					return False
+
+				self._journal_inode = inode
+				self._journal_offset = f.tell()
+				self._journal_count = 0
+
+			# replay the mutations appended since the last refresh
+			f.seek(self._journal_offset)
+			while True:
+				try:
+					op = pickle.load(f)
+				except (EOFError, pickle.UnpicklingError):
+					# stop at the end of the journal or at a partially written record
+					break
+				self.apply(op)
+				self._journal_offset = f.tell()
+				self._journal_count += 1
+
+		return True
+
+	def _signature(self):
+		# the write counter detects every write made through the lock, and the
+		# file metadata detects the collection file being replaced by other means
+		stat = os.stat(self._url)
+		return (self._lock.generation(), stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+	def _read_snapshot(self, f):
+		data = pickle.load(f)
+
+		# collection files of previous versions only contain the documents
+		if isinstance(data, list):
+			return 0, data
+
+		return data, pickle.load(f)
+
+	def _snapshot_generation(self):
+		with open(self._url, 'rb') as f:
+			data = pickle.load(f)
+			return 0 if isinstance(data, list) else data
+
+	def _journal_generation(self):
+		try:
+			with open(self._journal_url, 'rb') as f:
+				return pickle.load(f)
+		except (FileNotFoundError, EOFError):
+			return None
 
-	def save(self):
-		pickle.dump(self._db, open(self._url, 'wb'))
+	def _journal_reset(self):
+		# replace the journal by a new one that starts with the generation of the
+		# snapshot, so other processes notice the compaction
+		self._write_atomic(self._journal_url, [self._generation])
+
+	def _write_atomic(self, url, objs):
+		tmp_url = '%s.%d.tmp' % (url, os.getpid())
+
+		with open(tmp_url, 'wb') as f:
+			for obj in objs:
+				pickle.dump(obj, f)
+			f.flush()
+			os.fsync(f.fileno())
+
+		os.replace(tmp_url, url)
+
+		# persist the rename itself
+		fd = os.open(os.path.dirname(os.path.abspath(url)), os.O_RDONLY)
+		try:
+			os.fsync(fd)
+		finally:
+			os.close(fd)
+
+	@contextlib.contextmanager
+	def reading(self):
+		# files are replaced atomically and partial journal records are skipped,
+		# so readers don't wait for the writers of other processes
+		with self._memory:
+			self.refresh()
+			yield self
+
+	def write(self, ops):
+		# apply the mutations and return the error of each one, or None if it was saved
+		with self._lock.exclusive():
+			try:
+				with self._memory:
+					errors = self._apply_many(ops)
+					ops = [op for op, error in zip(ops, errors) if error == None]
+					if not ops:
+						return errors
+
+					# append the mutations to the journal in a single write, right after the
+					# mutations of other processes already replayed, so all of them share the same order
+					if self._journal:
+						with open(self._journal_url, 'ab') as f:
+							f.write(b''.join(pickle.dumps(op) for op in ops))
+							f.flush()
+							os.fsync(f.fileno())
+
+							self._journal_offset = f.tell()
+							self._journal_count += len(ops)
+
+						# compact the journal into a snapshot when it grows too large
+						if self._journal_count < self._compact_every:
+							return errors
+
+					# the documents are never changed in place, so the list is a consistent copy
+					docs = list(self.docs.values())
+
+				# write the snapshot without holding the documents in memory, so the readers of
+				# this process don't wait for it; meanwhile they may see the mutations being
+				# saved, which are acknowledged once the file is written
+				if self._journal:
+					self.compact(docs)
+					return errors
+
+				self.save(docs)
+
+				# let the other processes know that the collection file changed
+				self._lock.increment()
+				with self._memory:
+					self._loaded_signature = self._signature()
+
+				return errors
+			except:
+				# the documents in memory may not match the files anymore
+				self._loaded = False
+				raise
+
+	def _apply_many(self, ops):
+		# apply the mutations to the up-to-date documents in memory; when one of them fails
+		# the documents are reloaded and the others are applied again without it, so it
+		# fails on its own and is never saved
+		errors = [None] * len(ops)
+
+		while True:
+			self.refresh()
+			try:
+				for i, op in enumerate(ops):
+					if errors[i] == None:
+						self._check(op)
+						self.apply(op)
+				return errors
+			except Exception as e:
+				errors[i] = e
+				self._loaded = False
+
+	def _check(self, op):
+		# reject the insertion of a document whose id or unique keys are already used, under the
+		# exclusive lock so concurrent processes can't insert both; the mutations replayed from
+		# the journal were checked when they were written
+		action, id, doc = op
+
+		if action == 'insert':
+			if doc['_id'] in self.docs:
+				raise IndexError('Document \"%s\" already exists in collection \"%s\"' % (doc['_id'], self.name))
+
+			for k in self._hash_keys:
+				if doc[k] in self.keys[k]:
+					raise IndexError('Document with %s \"%s\" already exists in collection \"%s\"' % (k, doc[k], self.name))
+
+	def apply(self, op):
+		action, id, doc = op
+
+		# apply a partial update to a copy of the stored document, so the documents of
+		# previous mutations are never changed, and re-index it in case its keys change
+		if action == 'modify':
+			old = self.docs.get(id)
+			if old != None:
+				new = copy.deepcopy(old)
+				modify(new, doc)
+				self._unindex_doc(old)
+				self.docs[id] = new
+				self._index_doc(new)
+			return
+
+		# unindex the previous version of the document
+		old = self.docs.pop(id, None) if action != 'insert' else None
+		if old != None:
+			self._unindex_doc(old)
+
+		# store and index the new version of the document
+		if action == 'insert' or (action == 'update' and old != None):
+			self.docs[doc['_id']] = doc
+			self._index_doc(doc)
 
 
 	# ----------------
-	# User functions
+	# Index functions
 	# ----------------
-	async def user_query(self, page, page_size):
-		self._lock.acquire()
-		self.load()
+	def _index(self):
+		# build the secondary indexes from scratch
+		self.order = []
+		self.user_orders = {}
+		self.keys = {k: {} for k in self._hash_keys}
 
-		# sort users by date_created in descending order
-		self._db['users'].sort(key=lambda w: w['date_created'], reverse=True)
+		for d in self.docs.values():
+			self._index_doc(d, sort=False)
 
-		# return the specified page of users
-		users = self._db['users'][(page * page_size):((page + 1) * page_size)]
+		self.order.sort()
+		for order in self.user_orders.values():
+			order.sort()
 
-		self._lock.release()
+	def _sort_key(self, doc):
+		# documents without the sort field are kept at the end of the descending order
+		value = doc.get(self._order_key)
+		return (value != None, value, doc['_id'])
 
-		return users
+	def _index_doc(self, doc, sort=True):
+		insert = bisect.insort if sort else list.append
+		key = self._sort_key(doc)
 
-	async def user_create(self, user):
-		self._lock.acquire()
-		self.load()
-		
-		# get username
-		username = user['username']
+		insert(self.order, key)
 
-		# check if username already exists
-		found = next((True for u in self._db['users'] if u['username'] == username), False)
+		for k in self._hash_keys:
+			self.keys[k][doc[k]] = doc['_id']
 
-		# append user to list of users if user was not found
-		if not found:			
-			self._db['users'].append(user)
-			self.save()
-		
-		self._lock.release()
+		if self._user_index:
+			insert(self.user_orders.setdefault(doc['user_id'], []), key)
+
+	def _unindex_doc(self, doc):
+		def remove(order, key):
+			i = bisect.bisect_left(order, key)
+			if i < len(order) and order[i] == key:
+				del order[i]
+
+		key = self._sort_key(doc)
+
+		remove(self.order, key)
+
+		for k in self._hash_keys:
+			if self.keys[k].get(doc[k]) == doc['_id']:
+				del self.keys[k][doc[k]]
+
+		if self._user_index:
+			remove(self.user_orders.get(doc['user_id'], []), key)
+
+	def page(self, order, page, page_size, cursor=None, fields=None):
+		# slice the requested page from the end of the ascending order, either
+		# right before the cursor or after skipping the previous pages
+		if cursor != None:
+			end = bisect.bisect_left(order, (True, *cursor))
+		else:
+			end = len(order) - page * page_size
+		start = max(0, end - page_size)
+		keys = reversed(order[start:end]) if end > 0 else []
+
+		return [copy.deepcopy(project(self.docs[key[-1]], fields)) for key in keys]
+
+	def get(self, id, fields=None):
+		# return copies of documents held in memory across requests
+		doc = self.docs.get(id)
+		return copy.deepcopy(project(doc, fields)) if doc != None else None
+
+
+
+class TaskCollection(FileCollection):
+
+	# tasks are also indexed by run and pipeline, so the tasks of a pipeline
+	# are found without scanning the whole collection, and each pipeline keeps
+	# a catalogue entry with its last event time, its processes and their
+	# resource statistics
+
+	def _index(self):
+		self.runs = {}
+		self.pipeline_runs = {}
+		self.run_tasks = {}
+		self.pipelines = {}
+		self.process_stats = {}
+		self._run_starts = {}
+
+		super()._index()
+
+	def _index_doc(self, doc, sort=True):
+		super()._index_doc(doc, sort)
+
+		event = doc.get('event')
+		run_id = doc.get('runId')
+		pipeline = task_pipeline(doc)
+
+		# map the run to its pipeline on the 'started' event of the run
+		if event == 'started' and pipeline != None:
+			if run_id not in self.runs:
+				self.runs[run_id] = pipeline
+				self.pipeline_runs.setdefault(pipeline, {})[run_id] = None
+
+				# catalogue the processes of the run received before this event
+				for id in self.run_tasks.get(run_id, {}):
+					self._catalogue_add(pipeline, self.docs[id])
+
+			self._run_starts[run_id] = self._run_starts.get(run_id, 0) + 1
+
+		# group the completed processes by run, in the order they are received
+		elif event == 'process_completed':
+			self.run_tasks.setdefault(run_id, {})[doc['_id']] = None
+
+		if run_id in self.runs:
+			self._catalogue_add(self.runs[run_id], doc)
+
+	def _unindex_doc(self, doc):
+		super()._unindex_doc(doc)
+
+		event = doc.get('event')
+		run_id = doc.get('runId')
+
+		if event == 'process_completed':
+			if run_id in self.runs:
+				self._catalogue_remove(self.runs[run_id], doc)
+
+			run_tasks = self.run_tasks.get(run_id, {})
+			run_tasks.pop(doc['_id'], None)
+			if not run_tasks:
+				self.run_tasks.pop(run_id, None)
+
+		# forget the run when its last 'started' event is removed
+		elif event == 'started' and task_pipeline(doc) != None:
+			self._run_starts[run_id] -= 1
+			if self._run_starts[run_id] == 0:
+				del self._run_starts[run_id]
+
+				pipeline = self.runs.pop(run_id)
+				del self.pipeline_runs[pipeline][run_id]
+
+				for id in self.run_tasks.get(run_id, {}):
+					self._catalogue_remove(pipeline, self.docs[id])
+
+				if not self.pipeline_runs[pipeline]:
+					del self.pipeline_runs[pipeline]
+					del self.pipelines[pipeline]
+
+	def _catalogue_add(self, pipeline, doc):
+		entry = self.pipelines.setdefault(pipeline, {'last_seen': None, 'processes': {}})
+
+		if doc.get('utcTime') != None and (entry['last_seen'] == None or doc['utcTime'] > entry['last_seen']):
+			entry['last_seen'] = doc['utcTime']
+
+		# count the tasks of each process so they can be removed
+		process = task_process(doc)
+		if doc.get('event') == 'process_completed' and process != None:
+			entry['processes'][process] = entry['processes'].get(process, 0) + 1
+
+			stats.add(self.process_stats.setdefault((pipeline, process), {}), stats.trace_values(doc['trace']))
+
+	def _catalogue_remove(self, pipeline, doc):
+		processes = self.pipelines[pipeline]['processes']
+		process = task_process(doc)
+		if process == None:
+			return
+
+		processes[process] -= 1
+		if processes[process] == 0:
+			del processes[process]
+			del self.process_stats[(pipeline, process)]
+		else:
+			stats.remove(self.process_stats[(pipeline, process)], stats.trace_values(doc['trace']))
+
+	def catalogue(self):
+		return [{
+			'name': pipeline,
+			'n_runs': len(runs),
+			'last_seen': self.pipelines[pipeline]['last_seen'],
+			'processes': sorted(self.pipelines[pipeline]['processes'])
+		} for pipeline, runs in self.pipeline_runs.items()]
+
+	def pipeline_stats(self, pipeline):
+		return {process: stats.summary(entry) for (p, process), entry in self.process_stats.items() if p == pipeline}
+
+	def pipeline_task_ids(self, pipeline, by_process=False):
+		# return the ids of the completed processes of every run of the pipeline,
+		# optionally grouped by process in the order of the process names
+		ids = [id for run_id in self.pipeline_runs.get(pipeline, {}) for id in self.run_tasks.get(run_id, {})]
+
+		if by_process:
+			ids.sort(key=lambda id: task_process(self.docs[id]) or '')
+
+		return ids
+
+	def pipeline_tasks(self, pipeline, ids=None, process=None):
+		# return copies of the completed processes of the pipeline, or of the given
+		# ones that still exist, optionally only of one process
+		ids = self.pipeline_task_ids(pipeline) if ids == None else [id for id in ids if id in self.docs]
+		return [self.get(id) for id in ids if process == None or task_process(self.docs[id]) == process]
+
+
+
+
+# /*
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# 	FILE BACKEND
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#		Class that saves the dataset, workflows and tasks information into a file per collection
+# ----------------------------------------------------------------------------------------
+# */
+
+class FileBackend(Backend):
+
+	COLLECTIONS = ['users', 'datasets', 'workflows', 'tasks']
+
+	# field used to sort each collection in descending order
+	ORDER_KEYS = {
+		'users': 'date_created',
+		'datasets': 'date_created',
+		'workflows': 'date_created',
+		'tasks': 'utcTime'
+	}
+
+	# unique fields used to get the documents besides the id
+	HASH_KEYS = {
+		'users': ['username']
+	}
+
+	# collections grouped by the user who owns the documents
+	USER_COLLECTIONS = ['datasets', 'workflows']
+
+	# collections with additional indexes
+	COLLECTION_CLASSES = {
+		'tasks': TaskCollection
+	}
+
+	# number of documents copied at once by the iterators
+	READ_BATCH_SIZE = 1000
+
+	def __init__(self, url, journal=False, compact_every=10000, batch_window=0, batch_size=1000):
+		self._url = url
+		self._batch_window = batch_window
+		self._batch_size = batch_size
+
+		# store each collection in its own file next to the database file, e.g. 'db.tasks.pkl'
+		root, ext = os.path.splitext(url)
+		self._db = {c: self.COLLECTION_CLASSES.get(c, FileCollection)(
+			c,
+			'%s.%s%s' % (root, c, ext),
+			self.ORDER_KEYS[c],
+			hash_keys=self.HASH_KEYS.get(c, []),
+			user_index=c in self.USER_COLLECTIONS,
+			journal=journal,
+			compact_every=compact_every
+		) for c in self.COLLECTIONS}
+
+		self.initialize()
+
+	def initialize(self, error_not_found=False):
+		# the thread and the pending writes are created on first use by each process
+		self._pid = None
+
+		for c in self._db.values():
+			c.initialize(legacy_url=self._url)
+
+	def _process(self):
+		# start them again after a fork, since the thread of the parent doesn't exist
+		# in the child and its pending writes belong to the event loop of the parent
+		if self._pid != os.getpid():
+			# run the file operations on a single thread so the event loop is never blocked, and
+			# the reads on another one, so they don't wait for the batches being saved
+			self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+			self._read_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+
+			# writes waiting for the next flush
+			self._pending = []
+			self._flush_handle = None
+			self._flush_lock = asyncio.Lock()
+
+			self._pid = os.getpid()
+
+	async def _run(self, fn, *args):
+		self._process()
+		return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+	async def _read(self, collection, fn):
+		# call fn with the up-to-date collection on the read thread
+		def read():
+			with self._db[collection].reading() as c:
+				return fn(c)
+
+		self._process()
+		return await asyncio.get_running_loop().run_in_executor(self._read_executor, read)
+
+	async def _commit(self, action, collection, id=None, doc=None):
+		await self._commit_many(collection, [(action, id, doc)])
+
+	async def _commit_many(self, collection, ops):
+		self._process()
+
+		futures = []
+		for action, id, doc in ops:
+			# keep an independent copy so callers can't alter the stored document
+			op = (action, id, copy.deepcopy(doc))
+			future = asyncio.get_running_loop().create_future()
+
+			self._pending.append((collection, op, future))
+			futures.append(future)
+
+		# flush when the batch is full, otherwise wait for more writes during the batch window
+		if len(self._pending) >= self._batch_size:
+			asyncio.ensure_future(self._flush())
+		elif self._flush_handle == None:
+			self._flush_handle = asyncio.get_running_loop().call_later(self._batch_window, lambda: asyncio.ensure_future(self._flush()))
+
+		# acknowledge the writes once their batch is on disk
+		await asyncio.gather(*futures)
+
+	async def _flush(self):
+		# flush one batch at a time, the writes received meanwhile are grouped into the next one
+		async with self._flush_lock:
+			if self._flush_handle != None:
+				self._flush_handle.cancel()
+				self._flush_handle = None
+
+			batch, self._pending = self._pending, []
+
+			# write the mutations of each collection at once
+			for c in self.COLLECTIONS:
+				writes = [(op, future) for collection, op, future in batch if collection == c]
+				if not writes:
+					continue
+
+				try:
+					errors = await self._run(self._db[c].write, [op for op, _ in writes])
+				except Exception as e:
+					errors = [e] * len(writes)
+
+				# fail only the writes that couldn't be applied
+				for (_, future), error in zip(writes, errors):
+					if future.done():
+						continue
+					if error != None:
+						future.set_exception(error)
+					else:
+						future.set_result(None)
+
+
+	# ----------------
+	# User functions
+	# ----------------
+	async def user_query(self, page, page_size, cursor=None, fields=None):
+		# return the specified page of users sorted by date_created in descending order
+		return await self._read('users', lambda users: users.page(users.order, page, page_size, cursor, fields))
+
+	async def user_create(self, user):
+		# check if username already exists or is about to be created
+		username = user['username']
+		found = await self._read('users', lambda users: username in users.keys['username'])
+		found = found or any(op[0] == 'insert' and op[2]['username'] == username for c, op, _ in self._pending if c == 'users')
 
 		# raise error if user was found
 		if found:
 			raise IndexError('User already exists')
 
-	async def user_get(self, username):
-		self._lock.acquire()
-		self.load()
+		# append user to list of users, which fails if another process created it meanwhile
+		try:
+			await self._commit('insert', 'users', doc=user)
+		except IndexError:
+			raise IndexError('User already exists')
 
+	async def user_get(self, username, fields=None):
 		# get user
-		user = next((u for u in self._db['users'] if u['username'] == username), None)
-		
-		self._lock.release()
+		user = await self._read('users', lambda users: users.get(users.keys['username'].get(username), fields))
 
 		# raise error if user wasn't found
 		if user == None:
@@ -170,94 +962,51 @@ class FileBackend(Backend):
 		return user
 
 	async def user_update(self, id, user):
-		self._lock.acquire()
-		self.load()
-
-		# search for user by id and update it
-		found = False
-
-		for i, d in enumerate(self._db['users']):
-			if d['_id'] == id:
-				# update user
-				self._db['users'][i] = user
-				found = True
-				break
-
-		self.save()
-		self._lock.release()
+		# search for user by id
+		found = await self._read('users', lambda users: id in users.docs)
 
 		# raise error if user wasn't found
 		if not found:
 			raise IndexError('User was not found')
 
-	async def user_delete(self, id):
-		self._lock.acquire()
-		self.load()
-
-		# search for user by id and delete it
-		found = False
-
-		for i, d in enumerate(self._db['users']):
-			if d['_id'] == id:
-				# delete user
-				self._db['users'].pop(i)
-				found = True
-				break
+		# update user
+		await self._commit('update', 'users', id, user)
 
-		self.save()
-		self._lock.release()
+	async def user_delete(self, id):
+		# search for user by id
+		found = await self._read('users', lambda users: id in users.docs)
 
 		# raise error if user wasn't found
 		if not found:
 			raise IndexError('User was not found')
 
+		# delete user
+		await self._commit('delete', 'users', id)
+
 
 	# ----------------
 	# Dataset functions
 	# ----------------
-	async def dataset_query(self, user_id, page, page_size):
-		self._lock.acquire()
-		self.load()
-
-		# get the datasets from a user id
-		if user_id == 'admin':
-			datasets = self._db['datasets']
-		else:
-			datasets = [d for d in self._db['datasets'] if d['user_id'] == user_id]
+	async def dataset_query(self, user_id, page, page_size, cursor=None, fields=None):
+		def query(datasets):
+			# get the datasets from a user id
+			if user_id == 'admin':
+				order = datasets.order
+			else:
+				order = datasets.user_orders.get(user_id, [])
 
-		# sort datasets by date_created in descending order
-		datasets.sort(key=lambda w: w['date_created'], reverse=True)
+			# return the specified page of datasets sorted by date_created in descending order
+			return datasets.page(order, page, page_size, cursor, fields)
 
-		# return the specified page of datasets
-		datasets = datasets[(page * page_size):((page + 1) * page_size)]
-
-		self._lock.release()
-
-		return datasets
+		return await self._read('datasets', query)
 
 	async def dataset_create(self, dataset):
-		self._lock.acquire()
-		self.load()
-
 		# append dataset to list of datasets
-		self._db['datasets'].append(dataset)
-
-		self.save()
-		self._lock.release()
-
-	async def dataset_get(self, id):
-		self._lock.acquire()
-		self.load()
+		await self._commit('insert', 'datasets', doc=dataset)
 
+	async def dataset_get(self, id, fields=None):
 		# search for dataset by id
-		dataset = None
-
-		for d in self._db['datasets']:
-			if d['_id'] == id:
-				dataset = d
-				break
-
-		self._lock.release()
+		dataset = await self._read('datasets', lambda datasets: datasets.get(id, fields))
 
 		# return dataset or raise error if dataset wasn't found
 		if dataset != None:
@@ -266,94 +1015,51 @@ class FileBackend(Backend):
 			raise IndexError('Dataset was not found')
 
 	async def dataset_update(self, id, dataset):
-		self._lock.acquire()
-		self.load()
-
-		# search for dataset by id and update it
-		found = False
-
-		for i, d in enumerate(self._db['datasets']):
-			if d['_id'] == id:
-				# update dataset
-				self._db['datasets'][i] = dataset
-				found = True
-				break
-
-		self.save()
-		self._lock.release()
+		# search for dataset by id
+		found = await self._read('datasets', lambda datasets: id in datasets.docs)
 
 		# raise error if dataset wasn't found
 		if not found:
 			raise IndexError('Dataset was not found')
 
-	async def dataset_delete(self, id):
-		self._lock.acquire()
-		self.load()
+		# update dataset
+		await self._commit('update', 'datasets', id, dataset)
 
-		# search for dataset by id and delete it
-		found = False
-
-		for i, d in enumerate(self._db['datasets']):
-			if d['_id'] == id:
-				# delete dataset
-				self._db['datasets'].pop(i)
-				found = True
-				break
-
-		self.save()
-		self._lock.release()
+	async def dataset_delete(self, id):
+		# search for dataset by id
+		found = await self._read('datasets', lambda datasets: id in datasets.docs)
 
 		# raise error if dataset wasn't found
 		if not found:
 			raise IndexError('Dataset was not found')
 
+		# delete dataset
+		await self._commit('delete', 'datasets', id)
+
 
 	# ----------------
 	# Workflow functions
 	# ----------------
-	async def workflow_query(self, user_id, page, page_size):
-		self._lock.acquire()
-		self.load()
-
-		# get the workflows from a user id
-		if user_id == 'admin':
-			workflows = self._db['workflows']
-		else:
-			workflows = [d for d in self._db['workflows'] if d['user_id'] == user_id]
-
-		# sort workflows by date_created in descending order
-		workflows.sort(key=lambda w: w['date_created'], reverse=True)
+	async def workflow_query(self, user_id, page, page_size, cursor=None, fields=None):
+		def query(workflows):
+			# get the workflows from a user id
+			if user_id == 'admin':
+				order = workflows.order
+			else:
+				order = workflows.user_orders.get(user_id, [])
 
-		# return the specified page of workflows
-		workflows = workflows[(page * page_size) : ((page + 1) * page_size)]
+			# return the specified page of workflows sorted by date_created in descending order
+			return workflows.page(order, page, page_size, cursor, fields)
 
-		self._lock.release()
-
-		return workflows
+		return await self._read('workflows', query)
 
 	async def workflow_create(self, workflow):
-		self._lock.acquire()
-		self.load()
-
 		# append workflow to list of workflows
-		self._db['workflows'].append(workflow)
-
-		self.save()
-		self._lock.release()
-
-	async def workflow_get(self, id):
-		self._lock.acquire()
-		self.load()
+		await self._commit('insert', 'workflows', doc=workflow)
 
+	async def workflow_get(self, id, fields=None):
 		# search for workflow by id
-		workflow = None
-
-		for w in self._db['workflows']:
-			if w['_id'] == id:
-				workflow = w
-				break
-
-		self._lock.release()
+		workflow = await self._read('workflows', lambda workflows: workflows.get(id, fields))
 
 		# return workflow or raise error if workflow wasn't found
 		if workflow != None:
@@ -362,144 +1068,111 @@ class FileBackend(Backend):
 			raise IndexError('Workflow was not found')
 
 	async def workflow_update(self, id, workflow):
-		self._lock.acquire()
-		self.load()
+		# search for workflow by id
+		found = await self._read('workflows', lambda workflows: id in workflows.docs)
 
-		# search for workflow by id and update it
-		found = False
+		# raise error if workflow wasn't found
+		if not found:
+			raise IndexError('Workflow was not found')
 
-		for i, w in enumerate(self._db['workflows']):
-			if w['_id'] == id:
-				# update workflow
-				self._db['workflows'][i] = workflow
-				found = True
-				break
+		# update workflow
+		await self._commit('update', 'workflows', id, workflow)
 
-		self.save()
-		self._lock.release()
+	async def _workflow_modify(self, id, update):
+		# search for workflow by id
+		found = await self._read('workflows', lambda workflows: id in workflows.docs)
 
 		# raise error if workflow wasn't found
 		if not found:
 			raise IndexError('Workflow was not found')
 
-	async def workflow_delete(self, id):
-		self._lock.acquire()
-		self.load()
+		# the update is applied to the latest version of the workflow when the batch is flushed
+		await self._commit('modify', 'workflows', id, update)
 
-		# search for workflow by id and delete it
-		found = False
+	async def workflow_set_fields(self, id, fields):
+		await self._workflow_modify(id, {'$set': fields})
 
-		for i, w in enumerate(self._db['workflows']):
-			if w['_id'] == id:
-				# delete workflow
-				self._db['workflows'].pop(i)
-				found = True
-				break
+	async def attempt_create(self, id, attempt, fields={}):
+		await self._workflow_modify(id, {'$set': fields, '$push': {'attempts': attempt}})
 
-		self.save()
-		self._lock.release()
+	async def attempt_set_fields(self, id, n_attempt, fields, workflow_fields={}):
+		await self._workflow_modify(id, {'$set': {**workflow_fields, **{'attempts.%d.%s' % (n_attempt, k): v for k, v in fields.items()}}})
+
+	async def workflow_delete(self, id):
+		# search for workflow by id
+		found = await self._read('workflows', lambda workflows: id in workflows.docs)
 
 		# raise error if workflow wasn't found
 		if not found:
 			raise IndexError('Workflow was not found')
 
+		# delete workflow
+		await self._commit('delete', 'workflows', id)
+
 
 
 	# ----------------
 	# Output functions
 	# ----------------
 	async def output_delete(self, id, attempt):
-		self._lock.acquire()
-		self.load()
-
-		# search for workflow by id and delete it
-		found = False
-
-		for i, w in enumerate(self._db['workflows']):
-			if w['_id'] == id:
-				for j, a in enumerate(w['attempts']):
-					if str(a['id']) == attempt:
-						# delete outpus
-						self._db['workflows'][i]['attempts'].pop(j)
-						self._db['workflows'][i]['n_attempts'] -= 1
-						found = True
-						break
+		# search for the attempt of the workflow
+		def find(workflows):
+			workflow = workflows.docs.get(id)
+			return next((a['id'] for a in workflow['attempts'] if str(a['id']) == attempt), None) if workflow != None else None
 
-		self.save()
-		self._lock.release()
+		attempt_id = await self._read('workflows', find)
 
 		# raise error if workflow wasn't found
-		if not found:
+		if attempt_id == None:
 			raise IndexError('Output was not found')
 
+		# delete the attempt from the latest version of the workflow when the batch is flushed
+		await self._commit('modify', 'workflows', id, {'$pull': {'attempts': {'id': attempt_id}}, '$inc': {'n_attempts': -1}})
+
 
 
 	# ----------------
 	# Task functions
 	# ----------------
-	async def task_query(self, page, page_size):
-		self._lock.acquire()
-		self.load()
-
-		# sort tasks by date_created in descending order
-		self._db['tasks'].sort(key=lambda t: t['utcTime'], reverse=True)
-
-		# return the specified page of workflows
-		tasks = self._db['tasks'][(page * page_size) : ((page + 1) * page_size)]
-
-		self._lock.release()
-
-		return tasks
-
-	async def task_query_pipelines(self):
-		self._lock.acquire()
-		self.load()
-
-		# extract list of unique pipelines from all 'started' events
-		pipelines = [t['metadata']['workflow']['projectName'] for t in self._db['tasks'] if t['event'] == 'started']
-		pipelines = list(set(pipelines))
-
-		self._lock.release()
-
-		return pipelines
+	async def task_query(self, page, page_size, cursor=None, fields=None):
+		# return the specified page of tasks sorted by utcTime in descending order
+		return await self._read('tasks', lambda tasks: tasks.page(tasks.order, page, page_size, cursor, fields))
+
+	async def task_query_pipelines(self, details=False):
+		# list the pipelines, or their catalogue entries, from the runs index
+		if details:
+			return await self._read('tasks', lambda tasks: tasks.catalogue())
+		else:
+			return await self._read('tasks', lambda tasks: list(tasks.pipeline_runs))
 
 	async def task_query_pipeline(self, pipeline):
-		self._lock.acquire()
-		self.load()
-
-		# find all runs of the given pipeline
-		run_ids = [t['runId'] for t in self._db['tasks'] if t['event'] == 'started' and t['metadata']['workflow']['projectName'] == pipeline]
+		# find all tasks associated with the runs of the given pipeline
+		return await self._read('tasks', lambda tasks: tasks.pipeline_tasks(pipeline))
 
-		# find all tasks associated with the given runs
-		tasks = [t for t in self._db['tasks'] if t['event'] == 'process_completed' and t['runId'] in run_ids]
+	async def task_iter_pipeline(self, pipeline, process=None, by_process=False):
+		# find the tasks of the pipeline in the runs index, then copy them in batches
+		ids = await self._read('tasks', lambda tasks: tasks.pipeline_task_ids(pipeline, by_process))
 
-		self._lock.release()
+		for i in range(0, len(ids), self.READ_BATCH_SIZE):
+			batch = ids[i:i + self.READ_BATCH_SIZE]
+			for task in await self._read('tasks', lambda tasks: tasks.pipeline_tasks(pipeline, batch, process)):
+				yield task
 
-		return tasks
+	async def task_query_stats(self, pipeline):
+		# read the resource statistics of each process of the pipeline
+		return await self._read('tasks', lambda tasks: tasks.pipeline_stats(pipeline))
 
 	async def task_create(self, task):
-		self._lock.acquire()
-		self.load()
+		# append task to list of tasks
+		await self._commit('insert', 'tasks', doc=task)
 
-		# append workflow to list of workflows
-		self._db['tasks'].append(task)
-
-		self.save()
-		self._lock.release()
-
-	async def task_get(self, id):
-		self._lock.acquire()
-		self.load()
+	async def task_create_many(self, tasks):
+		# append all tasks to list of tasks in the same flush
+		await self._commit_many('tasks', [('insert', None, t) for t in tasks])
 
+	async def task_get(self, id, fields=None):
 		# search for task by id
-		task = None
-
-		for t in self._db['tasks']:
-			if t['_id'] == id:
-				task = t
-				break
-
-		self._lock.release()
+		task = await self._read('tasks', lambda tasks: tasks.get(id, fields))
 
 		# raise error if task wasn't found
 		if task != None:
@@ -519,24 +1192,150 @@ class FileBackend(Backend):
 # */
 
 class MongoBackend(Backend):
+
+	# indexes ensured at startup, as (collection, name, keys, options)
+	INDEXES = [
+		('users', 'username', [('username', pymongo.ASCENDING)], {'unique': True}),
+		('users', 'date_created', [('date_created', pymongo.DESCENDING), ('_id', pymongo.DESCENDING)], {}),
+		('datasets', 'date_created', [('date_created', pymongo.DESCENDING), ('_id', pymongo.DESCENDING)], {}),
+		('datasets', 'user_id_date_created', [('user_id', pymongo.ASCENDING), ('date_created', pymongo.DESCENDING), ('_id', pymongo.DESCENDING)], {}),
+		('workflows', 'date_created', [('date_created', pymongo.DESCENDING), ('_id', pymongo.DESCENDING)], {}),
+		('workflows', 'user_id_date_created', [('user_id', pymongo.ASCENDING), ('date_created', pymongo.DESCENDING), ('_id', pymongo.DESCENDING)], {}),
+		('tasks', 'utc_time', [('utcTime', pymongo.DESCENDING), ('_id', pymongo.DESCENDING)], {}),
+		('tasks', 'event_project_name', [('event', pymongo.ASCENDING), ('metadata.workflow.projectName', pymongo.ASCENDING)], {}),
+		('tasks', 'run_id_event', [('runId', pymongo.ASCENDING), ('event', pymongo.ASCENDING)], {}),
+		('runs', 'project_name', [('projectName', pymongo.ASCENDING)], {}),
+		('process_stats', 'pipeline_process', [('pipeline', pymongo.ASCENDING), ('process', pymongo.ASCENDING)], {'unique': True})
+	]
+
+	# number of documents received per round trip by the iterators
+	READ_BATCH_SIZE = 1000
+
+	# number of runs whose pipeline is kept in memory
+	RUN_CACHE_SIZE = 10000
+
 	def __init__(self, url):
 		self._url = url
+		self._run_pipelines = {}
 		self.initialize()
 
 	def initialize(self):
 		self._client = motor.motor_tornado.MotorClient(self._url)
 		self._db = self._client[env.MONGODB_DB]
 
+	def close(self):
+		self._client.close()
+
+
+	async def startup(self):
+		# create the missing indexes, existing ones are left untouched
+		for collection in dict.fromkeys(c for c, _, _, _ in self.INDEXES):
+			indexes = [pymongo.IndexModel(keys, name=name, **options) for c, name, keys, options in self.INDEXES if c == collection]
+
+			try:
+				await self._db[collection].create_indexes(indexes)
+			except pymongo.errors.OperationFailure as e:
+				print('** indexes of collection "%s": %s' % (collection, e), flush=True)
+
+		# build the runs collection from the 'started' events saved before it existed
+		if await self._db.runs.estimated_document_count() == 0:
+			await self._db.tasks.aggregate([
+				{ '$match': { 'event': 'started', 'metadata.workflow.projectName': { '$type': 'string' } } },
+				{ '$group': { '_id': '$runId', 'projectName': { '$last': '$metadata.workflow.projectName' } } },
+				{ '$merge': { 'into': 'runs', 'whenMatched': 'replace' } }
+			]).to_list(length=None)
+
+		# build the pipeline catalogue from the events of every run
+		if await self._db.pipelines.estimated_document_count() == 0:
+			await self._db.tasks.aggregate([
+				{ '$lookup': { 'from': 'runs', 'localField': 'runId', 'foreignField': '_id', 'as': 'run' } },
+				{ '$unwind': '$run' },
+				{ '$group': {
+					'_id': '$run.projectName',
+					'runs': { '$addToSet': '$runId' },
+					'last_seen': { '$max': '$utcTime' }
+				} },
+				{ '$project': { 'n_runs': { '$size': '$runs' }, 'last_seen': 1 } },
+				{ '$merge': { 'into': 'pipelines', 'whenMatched': 'replace' } }
+			]).to_list(length=None)
+
+		# build the resource statistics from the completed processes of every run,
+		# the sketches are computed here since they have no aggregation operator
+		if await self._db.process_stats.estimated_document_count() == 0:
+			entries = {}
+
+			async for task in self._db.tasks.aggregate([
+				{ '$match': { 'event': 'process_completed' } },
+				{ '$lookup': { 'from': 'runs', 'localField': 'runId', 'foreignField': '_id', 'as': 'run' } },
+				{ '$unwind': '$run' },
+				{ '$project': { 'pipeline': '$run.projectName', 'utcTime': 1, 'trace': 1 } }
+			], batchSize=self.READ_BATCH_SIZE):
+				if task_process(task) != None:
+					entry = entries.setdefault((task['pipeline'], task_process(task)), { 'last_seen': None, 'metrics': {} })
+					entry['last_seen'] = max_time(entry['last_seen'], task.get('utcTime'))
+					stats.add(entry['metrics'], stats.trace_values(task['trace']))
+
+			# the startup runs before the server processes receive tasks, but the entries are
+			# merged into the ones saved meanwhile by another server sharing the database
+			# instead of being skipped or failing on the unique index
+			if entries:
+				await self._db.process_stats.bulk_write([pymongo.UpdateOne(
+					{ 'pipeline': p, 'process': process },
+					process_stats_update(entry),
+					upsert=True) for (p, process), entry in entries.items()], ordered=False)
+
+	async def index_report(self):
+		report = {}
+
+		for collection in dict.fromkeys(c for c, _, _, _ in self.INDEXES):
+			existing = await self._db[collection].index_information()
+
+			# number of operations that used each index since the server started
+			stats = await self._db[collection].aggregate([{ '$indexStats': {} }]).to_list(length=None)
+			stats = {s['name']: s['accesses'] for s in stats}
+
+			declared = [name for c, name, _, _ in self.INDEXES if c == collection]
+
+			report[collection] = [{
+				'name': name,
+				'keys': [list(k) for k in index['key']],
+				'declared': name in declared,
+				'exists': True,
+				'ops': stats[name]['ops'] if name in stats else None,
+				'since': stats[name]['since'].isoformat() if name in stats else None
+			} for name, index in existing.items()] + [{
+				'name': name,
+				'keys': [list(k) for k in keys],
+				'declared': True,
+				'exists': False,
+				'ops': None,
+				'since': None
+			} for c, name, keys, _ in self.INDEXES if c == collection and name not in existing]
+
+		return report
+
+	def _projection(self, fields):
+		return {f: 1 for f in fields} if fields != None else None
+
+	def _find_page(self, collection, query, projection, order_key, page, page_size, cursor):
+		# continue right after the cursor if given, so the index on (order_key, _id)
+		# is used instead of skipping the documents of the previous pages
+		if cursor != None:
+			value, id = cursor
+			query = {**query, '$or': [{order_key: {'$lt': value}}, {order_key: value, '_id': {'$lt': id}}]}
+
+		return collection \
+			.find(query, projection) \
+			.sort([(order_key, pymongo.DESCENDING), ('_id', pymongo.DESCENDING)]) \
+			.skip(page * page_size if cursor == None else 0) \
+			.to_list(length=page_size)
+
 
 	# ----------------
 	# User functions
 	# ----------------
-	async def user_query(self, page, page_size):
-		return await self._db.users \
-			.find() \
-			.sort('date_created', pymongo.DESCENDING) \
-			.skip(page * page_size) \
-			.to_list(length=page_size)
+	async def user_query(self, page, page_size, cursor=None, fields=None):
+		return await self._find_page(self._db.users, {}, self._projection(fields), 'date_created', page, page_size, cursor)
 
 	async def user_create(self, user):
 		# get username
@@ -552,8 +1351,8 @@ class MongoBackend(Backend):
 		# if user is not found, insert the new user
 		return await self._db.users.insert_one(user)
 
-	async def user_get(self, username):
-		return await self._db.users.find_one({ 'username': username })
+	async def user_get(self, username, fields=None):
+		return await self._db.users.find_one({ 'username': username }, self._projection(fields))
 
 	async def user_update(self, id, user):
 		return await self._db.users.replace_one({ '_id': id }, user)
@@ -566,20 +1365,16 @@ class MongoBackend(Backend):
 	# ----------------
 	# Dataset functions
 	# ----------------
-	async def dataset_query(self, user_id, page, page_size):
+	async def dataset_query(self, user_id, page, page_size, cursor=None, fields=None):
 		# if admin retrieves all; otherwise only created by user_id
 		query = {} if user_id == 'admin' else {'user_id': user_id}
-		return await self._db.datasets \
-			.find(query) \
-			.sort('date_created', pymongo.DESCENDING) \
-			.skip(page * page_size) \
-			.to_list(length=page_size)
+		return await self._find_page(self._db.datasets, query, self._projection(fields), 'date_created', page, page_size, cursor)
 
 	async def dataset_create(self, dataset):
 		return await self._db.datasets.insert_one(dataset)
 
-	async def dataset_get(self, id):
-		return await self._db.datasets.find_one({ '_id': id })
+	async def dataset_get(self, id, fields=None):
+		return await self._db.datasets.find_one({ '_id': id }, self._projection(fields))
 
 	async def dataset_update(self, id, dataset):
 		return await self._db.datasets.replace_one({ '_id': id }, dataset)
@@ -592,24 +1387,29 @@ class MongoBackend(Backend):
 	# ----------------
 	# Workflow functions
 	# ----------------
-	async def workflow_query(self, user_id, page, page_size):
+	async def workflow_query(self, user_id, page, page_size, cursor=None, fields=None):
 		# if admin retrieves all; otherwise only created by user_id
 		query = {} if user_id == 'admin' else {'user_id': user_id}
-		return await self._db.workflows \
-			.find(query) \
-			.sort('date_created', pymongo.DESCENDING) \
-			.skip(page * page_size) \
-			.to_list(length=page_size)
+		return await self._find_page(self._db.workflows, query, self._projection(fields), 'date_created', page, page_size, cursor)
 
 	async def workflow_create(self, workflow):
 		return await self._db.workflows.insert_one(workflow)
 
-	async def workflow_get(self, id):
-		return await self._db.workflows.find_one({ '_id': id })
+	async def workflow_get(self, id, fields=None):
+		return await self._db.workflows.find_one({ '_id': id }, self._projection(fields))
 
 	async def workflow_update(self, id, workflow):
 		return await self._db.workflows.replace_one({ '_id': id }, workflow)
 
+	async def workflow_set_fields(self, id, fields):
+		return await self._db.workflows.update_one({ '_id': id }, { '$set': fields })
+
+	async def attempt_create(self, id, attempt, fields={}):
+		return await self._db.workflows.update_one({ '_id': id }, { '$set': fields, '$push': { 'attempts': attempt } })
+
+	async def attempt_set_fields(self, id, n_attempt, fields, workflow_fields={}):
+		return await self._db.workflows.update_one({ '_id': id }, { '$set': {**workflow_fields, **{'attempts.%d.%s' % (n_attempt, k): v for k, v in fields.items()}} })
+
 	async def workflow_delete(self, id):
 		return await self._db.workflows.delete_one({ '_id': id })
 
@@ -652,45 +1452,689 @@ class MongoBackend(Backend):
 	# ----------------
 	# Task functions
 	# ----------------
-	async def task_query(self, page, page_size):
-		return await self._db.tasks \
-			.find({}, { '_id': 1, 'runName': 1, 'utcTime': 1, 'event': 1 }) \
-			.sort('utcTime', pymongo.DESCENDING) \
-			.skip(page * page_size) \
-			.to_list(length=page_size)
+	async def task_query(self, page, page_size, cursor=None, fields=None):
+		projection = self._projection(fields) or { '_id': 1, 'runName': 1, 'utcTime': 1, 'event': 1 }
+		return await self._find_page(self._db.tasks, {}, projection, 'utcTime', page, page_size, cursor)
+
+	async def task_query_pipelines(self, details=False):
+		# read the pipeline catalogue
+		pipelines = await self._db.pipelines.find().to_list(length=None)
 
-	async def task_query_pipelines(self):
-		# find all 'started' events
-		tasks = await self._db.tasks \
-			.find({ 'event': 'started' }, { 'metadata.workflow.projectName': 1 }) \
-			.to_list(length=None)
+		if not details:
+			return [p['_id'] for p in pipelines]
 
-		# extract list of unique pipelines
-		pipelines = [t['metadata']['workflow']['projectName'] for t in tasks]
-		pipelines = list(set(pipelines))
+		# add the processes of each pipeline, kept with their statistics
+		processes = {}
+		for e in await self._db.process_stats.find({}, { 'pipeline': 1, 'process': 1, 'last_seen': 1 }).to_list(length=None):
+			processes.setdefault(e['pipeline'], []).append(e)
 
-		return pipelines
+		return [{
+			'name': p['_id'],
+			'n_runs': p.get('n_runs', 0),
+			'last_seen': functools.reduce(max_time, [e.get('last_seen') for e in processes.get(p['_id'], [])], p.get('last_seen')),
+			'processes': sorted(e['process'] for e in processes.get(p['_id'], []))
+		} for p in pipelines]
 
 	async def task_query_pipeline(self, pipeline):
-		# find all runs of the given pipeline
-		runs = await self._db.tasks \
-			.find({ 'event': 'started', 'metadata.workflow.projectName': pipeline }, { 'runId': 1 }) \
-			.to_list(length=None)
+		return [task async for task in self.task_iter_pipeline(pipeline)]
+
+	async def task_query_stats(self, pipeline):
+		entries = await self._db.process_stats.find({ 'pipeline': pipeline }).to_list(length=None)
+		return {e['process']: stats.summary(e['metrics']) for e in entries if e.get('metrics')}
+
+	async def task_iter_pipeline(self, pipeline, process=None, by_process=False):
+		match = { 'event': 'process_completed' }
+		if process != None:
+			match['trace.process'] = process
+
+		# join the runs of the pipeline with their completed processes on the server,
+		# the $unwind right after the $lookup avoids building an array per run
+		stages = [
+			{ '$match': { 'projectName': pipeline } },
+			{ '$lookup': {
+				'from': 'tasks',
+				'localField': '_id',
+				'foreignField': 'runId',
+				'pipeline': [
+					{ '$match': match },
+					{ '$project': { '_id': 0, 'trace': 1 } }
+				],
+				'as': 'task'
+			} },
+			{ '$unwind': '$task' },
+			{ '$replaceRoot': { 'newRoot': '$task' } }
+		]
+
+		# group the traces by process on the server, spilling the sort to disk if needed
+		if by_process:
+			stages.append({ '$sort': { 'trace.process': 1 } })
+
+		cursor = self._db.runs.aggregate(stages, batchSize=self.READ_BATCH_SIZE, allowDiskUse=by_process)
+
+		# receive the traces in batches
+		async for task in cursor:
+			yield task
+
+	def _cache_run(self, run_id, pipeline):
+		# the pipeline of a run never changes once the run is saved
+		if len(self._run_pipelines) >= self.RUN_CACHE_SIZE:
+			self._run_pipelines.pop(next(iter(self._run_pipelines)))
+
+		self._run_pipelines[run_id] = pipeline
+
+	async def _catalogue_update(self, tasks):
+		# Nextflow sends the 'started' event of a run before its other events, so each event is
+		# catalogued when it is saved, with the pipeline of its run, by the server process that
+		# saves it; the events received before the 'started' event of their run are left out,
+		# instead of being added later by another process that may count them twice
+
+		# map each run to its pipeline on the 'started' event of the run, the run
+		# is counted by the process that inserts it
+		started = {}
+		for t in tasks:
+			if t.get('event') == 'started' and task_pipeline(t) != None:
+				started.setdefault(t['runId'], task_pipeline(t))
+
+		new_runs = set()
+		if started:
+			result = await self._db.runs.bulk_write([pymongo.UpdateOne(
+				{ '_id': run_id },
+				{ '$setOnInsert': { 'projectName': pipeline } },
+				upsert=True) for run_id, pipeline in started.items()], ordered=False)
+
+			new_runs = set(result.upserted_ids.values())
+			for run_id in new_runs:
+				self._cache_run(run_id, started[run_id])
+
+		# find the pipeline of the runs that are not cached yet
+		run_ids = set(t.get('runId') for t in tasks) - set(self._run_pipelines)
+		if run_ids:
+			for run in await self._db.runs.find({ '_id': { '$in': list(run_ids) } }).to_list(length=None):
+				self._cache_run(run['_id'], run['projectName'])
+
+		# group the events by pipeline, and the completed tasks by process, whose catalogue
+		# entry is kept with its resource statistics, so each event needs a single update
+		pipelines = {}
+		entries = {}
+		for t in tasks:
+			pipeline = self._run_pipelines.get(t.get('runId'))
+			if pipeline == None:
+				continue
+
+			if t['event'] == 'process_completed' and task_process(t) != None:
+				entry = entries.setdefault((pipeline, task_process(t)), { 'last_seen': None, 'metrics': {} })
+				entry['last_seen'] = max_time(entry['last_seen'], t.get('utcTime'))
+				stats.add(entry['metrics'], stats.trace_values(t['trace']))
+			else:
+				update = pipelines.setdefault(pipeline, { 'last_seen': None, 'n_runs': 0 })
+				update['last_seen'] = max_time(update['last_seen'], t.get('utcTime'))
+				if t['event'] == 'started' and t['runId'] in new_runs:
+					update['n_runs'] += 1
+					new_runs.remove(t['runId'])
+
+		if pipelines:
+			await self._db.pipelines.bulk_write([pymongo.UpdateOne(
+				{ '_id': p },
+				{ '$max': { 'last_seen': update['last_seen'] }, '$inc': { 'n_runs': update['n_runs'] } },
+				upsert=True) for p, update in pipelines.items()], ordered=False)
+
+		# merge the statistics of the events of each process into the stored ones at once
+		if entries:
+			await self._db.process_stats.bulk_write([pymongo.UpdateOne(
+				{ 'pipeline': p, 'process': process },
+				process_stats_update(entry),
+				upsert=True) for (p, process), entry in entries.items()], ordered=False)
 
-		run_ids = [run['runId'] for run in runs]
+	async def task_create(self, task):
+		result = await self._db.tasks.insert_one(task)
+		await self._catalogue_update([task])
+
+		return result
+
+	async def task_create_many(self, tasks):
+		# unordered inserts are sent in parallel and don't stop at the first error,
+		# so the tasks inserted before a failure are still catalogued
+		try:
+			result = await self._db.tasks.insert_many(tasks, ordered=False)
+		except pymongo.errors.BulkWriteError as e:
+			failed = set(error['index'] for error in e.details['writeErrors'])
+			await self._catalogue_update([t for i, t in enumerate(tasks) if i not in failed])
+			raise
+
+		await self._catalogue_update(tasks)
+
+		return result
+
+	async def task_get(self, id, fields=None):
+		return await self._db.tasks.find_one({ '_id': id }, self._projection(fields))
 
-		# find all tasks associated with the given runs
-		tasks = await self._db.tasks \
-			.find({ 'event': 'process_completed', 'runId': { '$in': run_ids } }) \
-			.to_list(length=None)
 
-		return tasks
+
+
+# /*
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# 	SQLITE BACKEND
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#		Class that saves the dataset, workflows and tasks information into a SQLite database
+# ----------------------------------------------------------------------------------------
+# */
+
+class SqliteBackend(Backend):
+
+	# documents are pickled into the 'doc' column, the other columns are indexed copies of their fields
+	SCHEMA = [
+		'CREATE TABLE IF NOT EXISTS users (_id TEXT PRIMARY KEY, username TEXT UNIQUE NOT NULL, date_created INTEGER, doc BLOB NOT NULL)',
+		'CREATE INDEX IF NOT EXISTS users_date_created ON users (date_created, _id)',
+
+		'CREATE TABLE IF NOT EXISTS datasets (_id TEXT PRIMARY KEY, user_id TEXT, date_created INTEGER, doc BLOB NOT NULL)',
+		'CREATE INDEX IF NOT EXISTS datasets_date_created ON datasets (date_created, _id)',
+		'CREATE INDEX IF NOT EXISTS datasets_user_id ON datasets (user_id, date_created, _id)',
+
+		'CREATE TABLE IF NOT EXISTS workflows (_id TEXT PRIMARY KEY, user_id TEXT, date_created INTEGER, doc BLOB NOT NULL)',
+		'CREATE INDEX IF NOT EXISTS workflows_date_created ON workflows (date_created, _id)',
+		'CREATE INDEX IF NOT EXISTS workflows_user_id ON workflows (user_id, date_created, _id)',
+
+		'CREATE TABLE IF NOT EXISTS tasks (_id TEXT PRIMARY KEY, runId TEXT, event TEXT, utcTime TEXT, project_name TEXT, process TEXT, doc BLOB NOT NULL)',
+		'CREATE INDEX IF NOT EXISTS tasks_utc_time ON tasks (utcTime, _id)',
+		'CREATE INDEX IF NOT EXISTS tasks_event ON tasks (event, project_name)',
+		'CREATE INDEX IF NOT EXISTS tasks_run_id ON tasks (runId, event)',
+		'CREATE INDEX IF NOT EXISTS tasks_process ON tasks (runId, process)',
+
+		# pipeline catalogue, updated as the task events are saved
+		'CREATE TABLE IF NOT EXISTS runs (runId TEXT PRIMARY KEY, project_name TEXT NOT NULL)',
+		'CREATE INDEX IF NOT EXISTS runs_project_name ON runs (project_name)',
+		'CREATE TABLE IF NOT EXISTS pipelines (name TEXT PRIMARY KEY, n_runs INTEGER NOT NULL, last_seen TEXT)',
+		'CREATE TABLE IF NOT EXISTS pipeline_processes (name TEXT NOT NULL, process TEXT NOT NULL, PRIMARY KEY (name, process))',
+		'CREATE TABLE IF NOT EXISTS process_stats (name TEXT NOT NULL, process TEXT NOT NULL, stats BLOB NOT NULL, PRIMARY KEY (name, process))'
+	]
+
+	# number of rows read at once by the iterators
+	READ_BATCH_SIZE = 1000
+
+	def __init__(self, url):
+		self._url = url
+		self.initialize()
+
+	def initialize(self):
+		# the thread and its connection are created on first use by each process
+		self._pid = None
+
+		# create tables and indexes
+		self._process()
+		self._executor.submit(self._create).result()
+
+	def _process(self):
+		# start them again after a fork, since the thread of the parent doesn't exist
+		# in the child and sqlite connections can't be used across a fork
+		if self._pid != os.getpid():
+			# run every query on a single thread so the event loop is never blocked
+			self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+			self._local = threading.local()
+			self._pid = os.getpid()
+
+	def _connection(self):
+		# open one connection per thread, in autocommit mode and with WAL enabled
+		# so the other server processes can read while this one writes
+		if not hasattr(self._local, 'conn'):
+			conn = sqlite3.connect(self._url, timeout=30, isolation_level=None)
+			conn.execute('PRAGMA journal_mode=WAL')
+			conn.execute('PRAGMA synchronous=NORMAL')
+			self._local.conn = conn
+
+		return self._local.conn
+
+	def _create(self):
+		with self._transaction() as conn:
+			# add the process column to the tasks of previous versions, set for the completed processes
+			columns = [row[1] for row in conn.execute('PRAGMA table_info(tasks)')]
+			if columns and 'process' not in columns:
+				conn.execute('ALTER TABLE tasks ADD COLUMN process TEXT')
+
+				for rowid, doc in conn.execute("SELECT rowid, doc FROM tasks WHERE event = 'process_completed'").fetchall():
+					conn.execute('UPDATE tasks SET process = ? WHERE rowid = ?', (task_process(pickle.loads(doc)), rowid))
+
+			for statement in self.SCHEMA:
+				conn.execute(statement)
+
+	@contextlib.contextmanager
+	def _transaction(self):
+		# take the write lock up front so reads and writes see the same data
+		conn = self._connection()
+		conn.execute('BEGIN IMMEDIATE')
+		try:
+			yield conn
+			conn.execute('COMMIT')
+		except:
+			conn.execute('ROLLBACK')
+			raise
+
+	async def index_report(self):
+		def report():
+			conn = self._connection()
+			indexes = conn.execute("SELECT tbl_name, name FROM sqlite_master WHERE type = 'index' ORDER BY tbl_name, name").fetchall()
+
+			# sqlite doesn't count index usage
+			report = {}
+			for table, name in indexes:
+				report.setdefault(table, []).append({
+					'name': name,
+					'keys': [[row[2], 1] for row in conn.execute('PRAGMA index_info("%s")' % name)],
+					'declared': not name.startswith('sqlite_autoindex'),
+					'exists': True,
+					'ops': None,
+					'since': None
+				})
+
+			return report
+
+		return await self._run(report)
+
+	async def startup(self):
+		# the tables are checked inside the transaction, which holds the write lock,
+		# so they are built only once by the servers sharing the database
+		def catalogue():
+			# build the pipeline catalogue from the events saved before it existed
+			with self._transaction() as conn:
+				if conn.execute('SELECT 1 FROM runs LIMIT 1').fetchone() != None:
+					return
+
+				for run_id, pipeline in conn.execute("SELECT runId, project_name FROM tasks WHERE event = 'started' AND project_name IS NOT NULL").fetchall():
+					self._run_add(conn, run_id, pipeline)
+
+		def process_stats():
+			# build the resource statistics from the tasks saved before they existed
+			with self._transaction() as conn:
+				if conn.execute('SELECT 1 FROM process_stats LIMIT 1').fetchone() != None:
+					return
+
+				rows = conn.execute(
+					"SELECT runs.project_name, tasks.doc FROM tasks JOIN runs ON tasks.runId = runs.runId "
+					"WHERE tasks.event = 'process_completed'")
+
+				for pipeline, doc in rows:
+					self._stats_add(conn, pipeline, pickle.loads(doc))
+
+		await self._run(catalogue)
+		await self._run(process_stats)
+
+	async def _run(self, fn, *args):
+		self._process()
+		return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+	async def _execute(self, sql, params=()):
+		def execute():
+			return self._connection().execute(sql, params).rowcount
+
+		return await self._run(execute)
+
+	async def _fetch(self, sql, params=(), fields=None):
+		def fetch():
+			return [project(pickle.loads(row[0]), fields) for row in self._connection().execute(sql, params)]
+
+		return await self._run(fetch)
+
+	async def _fetch_one(self, sql, params, error, fields=None):
+		docs = await self._fetch(sql, params, fields)
+
+		# raise error if the document wasn't found
+		if not docs:
+			raise IndexError(error)
+
+		return docs[0]
+
+	async def _fetch_page(self, table, where, params, order_key, page, page_size, cursor, fields):
+		# continue right after the cursor if given, so the index on (order_key, _id)
+		# is used instead of skipping the rows of the previous pages
+		conditions = [where] if where else []
+		if cursor != None:
+			conditions.append('(%s, _id) < (?, ?)' % (order_key))
+			params = params + tuple(cursor)
+
+		where = ('WHERE %s ' % ' AND '.join(conditions)) if conditions else ''
+		offset = page * page_size if cursor == None else 0
+
+		return await self._fetch(
+			'SELECT doc FROM %s %sORDER BY %s DESC, _id DESC LIMIT ? OFFSET ?' % (table, where, order_key),
+			params + (page_size, offset), fields)
+
+
+	# ----------------
+	# User functions
+	# ----------------
+	async def user_query(self, page, page_size, cursor=None, fields=None):
+		return await self._fetch_page('users', None, (), 'date_created', page, page_size, cursor, fields)
+
+	async def user_create(self, user):
+		try:
+			await self._execute(
+				'INSERT INTO users (_id, username, date_created, doc) VALUES (?, ?, ?, ?)',
+				(user['_id'], user['username'], user['date_created'], pickle.dumps(user)))
+		except sqlite3.IntegrityError:
+			raise IndexError('User already exists')
+
+	async def user_get(self, username, fields=None):
+		return await self._fetch_one('SELECT doc FROM users WHERE username = ?', (username,), 'User was not found', fields)
+
+	async def user_update(self, id, user):
+		count = await self._execute(
+			'UPDATE users SET username = ?, date_created = ?, doc = ? WHERE _id = ?',
+			(user['username'], user['date_created'], pickle.dumps(user), id))
+
+		if count == 0:
+			raise IndexError('User was not found')
+
+	async def user_delete(self, id):
+		count = await self._execute('DELETE FROM users WHERE _id = ?', (id,))
+
+		if count == 0:
+			raise IndexError('User was not found')
+
+
+
+	# ----------------
+	# Dataset functions
+	# ----------------
+	async def dataset_query(self, user_id, page, page_size, cursor=None, fields=None):
+		# if admin retrieves all; otherwise only created by user_id
+		if user_id == 'admin':
+			return await self._fetch_page('datasets', None, (), 'date_created', page, page_size, cursor, fields)
+		else:
+			return await self._fetch_page('datasets', 'user_id = ?', (user_id,), 'date_created', page, page_size, cursor, fields)
+
+	async def dataset_create(self, dataset):
+		await self._execute(
+			'INSERT INTO datasets (_id, user_id, date_created, doc) VALUES (?, ?, ?, ?)',
+			(dataset['_id'], dataset['user_id'], dataset['date_created'], pickle.dumps(dataset)))
+
+	async def dataset_get(self, id, fields=None):
+		return await self._fetch_one('SELECT doc FROM datasets WHERE _id = ?', (id,), 'Dataset was not found', fields)
+
+	async def dataset_update(self, id, dataset):
+		count = await self._execute(
+			'UPDATE datasets SET user_id = ?, date_created = ?, doc = ? WHERE _id = ?',
+			(dataset['user_id'], dataset['date_created'], pickle.dumps(dataset), id))
+
+		if count == 0:
+			raise IndexError('Dataset was not found')
+
+	async def dataset_delete(self, id):
+		count = await self._execute('DELETE FROM datasets WHERE _id = ?', (id,))
+
+		if count == 0:
+			raise IndexError('Dataset was not found')
+
+
+
+	# ----------------
+	# Workflow functions
+	# ----------------
+	async def workflow_query(self, user_id, page, page_size, cursor=None, fields=None):
+		# if admin retrieves all; otherwise only created by user_id
+		if user_id == 'admin':
+			return await self._fetch_page('workflows', None, (), 'date_created', page, page_size, cursor, fields)
+		else:
+			return await self._fetch_page('workflows', 'user_id = ?', (user_id,), 'date_created', page, page_size, cursor, fields)
+
+	async def workflow_create(self, workflow):
+		await self._execute(
+			'INSERT INTO workflows (_id, user_id, date_created, doc) VALUES (?, ?, ?, ?)',
+			(workflow['_id'], workflow['user_id'], workflow['date_created'], pickle.dumps(workflow)))
+
+	async def workflow_get(self, id, fields=None):
+		return await self._fetch_one('SELECT doc FROM workflows WHERE _id = ?', (id,), 'Workflow was not found', fields)
+
+	async def workflow_update(self, id, workflow):
+		count = await self._execute(
+			'UPDATE workflows SET user_id = ?, date_created = ?, doc = ? WHERE _id = ?',
+			(workflow['user_id'], workflow['date_created'], pickle.dumps(workflow), id))
+
+		if count == 0:
+			raise IndexError('Workflow was not found')
+
+	async def _workflow_modify(self, id, update):
+		def write():
+			# read and write the workflow in the same transaction
+			with self._transaction() as conn:
+				row = conn.execute('SELECT doc FROM workflows WHERE _id = ?', (id,)).fetchone()
+				if row == None:
+					return False
+
+				workflow = pickle.loads(row[0])
+				modify(workflow, update)
+
+				conn.execute(
+					'UPDATE workflows SET user_id = ?, date_created = ?, doc = ? WHERE _id = ?',
+					(workflow['user_id'], workflow['date_created'], pickle.dumps(workflow), id))
+
+			return True
+
+		# raise error if workflow wasn't found
+		if not await self._run(write):
+			raise IndexError('Workflow was not found')
+
+	async def workflow_set_fields(self, id, fields):
+		await self._workflow_modify(id, {'$set': fields})
+
+	async def attempt_create(self, id, attempt, fields={}):
+		await self._workflow_modify(id, {'$set': fields, '$push': {'attempts': attempt}})
+
+	async def attempt_set_fields(self, id, n_attempt, fields, workflow_fields={}):
+		await self._workflow_modify(id, {'$set': {**workflow_fields, **{'attempts.%d.%s' % (n_attempt, k): v for k, v in fields.items()}}})
+
+	async def workflow_delete(self, id):
+		count = await self._execute('DELETE FROM workflows WHERE _id = ?', (id,))
+
+		if count == 0:
+			raise IndexError('Workflow was not found')
+
+
+
+	# ----------------
+	# Output functions
+	# ----------------
+	async def output_delete(self, id, attempt):
+		def delete():
+			# read and write the workflow in the same transaction
+			with self._transaction() as conn:
+				row = conn.execute('SELECT doc FROM workflows WHERE _id = ?', (id,)).fetchone()
+				workflow = pickle.loads(row[0]) if row else None
+
+				# search for the attempt of the workflow and delete it
+				found = False
+
+				if workflow != None:
+					for j, a in enumerate(workflow['attempts']):
+						if str(a['id']) == attempt:
+							workflow['attempts'].pop(j)
+							workflow['n_attempts'] -= 1
+							found = True
+							break
+
+				if found:
+					conn.execute('UPDATE workflows SET doc = ? WHERE _id = ?', (pickle.dumps(workflow), id))
+
+			return found
+
+		# raise error if workflow wasn't found
+		if not await self._run(delete):
+			raise IndexError('Output was not found')
+
+
+
+	# ----------------
+	# Task functions
+	# ----------------
+	async def task_query(self, page, page_size, cursor=None, fields=None):
+		return await self._fetch_page('tasks', None, (), 'utcTime', page, page_size, cursor, fields)
+
+	async def task_query_pipelines(self, details=False):
+		def query():
+			conn = self._connection()
+
+			# read the pipeline catalogue
+			pipelines = conn.execute('SELECT name, n_runs, last_seen FROM pipelines').fetchall()
+			if not details:
+				return [name for name, _, _ in pipelines]
+
+			processes = {}
+			for name, process in conn.execute('SELECT name, process FROM pipeline_processes ORDER BY process'):
+				processes.setdefault(name, []).append(process)
+
+			return [{
+				'name': name,
+				'n_runs': n_runs,
+				'last_seen': last_seen,
+				'processes': processes.get(name, [])
+			} for name, n_runs, last_seen in pipelines]
+
+		return await self._run(query)
+
+	async def task_query_pipeline(self, pipeline):
+		# find all tasks associated with the runs of the given pipeline
+		return await self._fetch(
+			"SELECT doc FROM tasks WHERE event = 'process_completed' AND runId IN ("
+			"SELECT runId FROM runs WHERE project_name = ?)",
+			(pipeline,))
+
+	async def task_iter_pipeline(self, pipeline, process=None, by_process=False):
+		def query(sql, params):
+			return self._connection().execute(sql, params).fetchall()
+
+		# find the tasks of the pipeline grouped by process in the (runId, process) index,
+		# which holds their rowids, then read them in batches so each task is read once
+		if process != None or by_process:
+			rowids = await self._run(query,
+				'SELECT rowid FROM tasks WHERE runId IN (SELECT runId FROM runs WHERE project_name = ?) AND %s ORDER BY process, rowid'
+				% ('process = ?' if process != None else 'process IS NOT NULL'),
+				(pipeline, process) if process != None else (pipeline,))
+
+			for i in range(0, len(rowids), self.READ_BATCH_SIZE):
+				batch = [rowid for (rowid,) in rowids[i:i + self.READ_BATCH_SIZE]]
+				docs = dict(await self._run(query, 'SELECT rowid, doc FROM tasks WHERE rowid IN (%s)' % ', '.join('?' * len(batch)), batch))
+
+				for rowid in batch:
+					yield pickle.loads(docs[rowid])
+
+			return
+
+		runs = await self._run(query, 'SELECT runId FROM runs WHERE project_name = ?', (pipeline,))
+
+		# otherwise read the tasks of each run in batches, continuing after the last
+		# row read so the (runId, event) index is scanned only once
+		for (run_id,) in runs:
+			rowid = 0
+
+			while True:
+				rows = await self._run(query,
+					"SELECT rowid, doc FROM tasks WHERE runId = ? AND event = 'process_completed' AND rowid > ? ORDER BY rowid LIMIT ?",
+					(run_id, rowid, self.READ_BATCH_SIZE))
+
+				if not rows:
+					break
+
+				rowid = rows[-1][0]
+
+				for _, doc in rows:
+					yield pickle.loads(doc)
+
+	def _task_row(self, task):
+		# get the pipeline name from the workflow metadata, and the process of a completed process
+		process = task_process(task) if task.get('event') == 'process_completed' else None
+
+		return (task['_id'], task.get('runId'), task.get('event'), task.get('utcTime'), task_pipeline(task), process, pickle.dumps(task))
+
+	def _run_add(self, conn, run_id, pipeline, pending=()):
+		# map the run to its pipeline, unless it is already known
+		if not conn.execute('INSERT OR IGNORE INTO runs (runId, project_name) VALUES (?, ?)', (run_id, pipeline)).rowcount:
+			return False
+
+		# catalogue the events of the run, including the ones received before its 'started' event,
+		# except the pending ones of the same batch, which are catalogued after this one
+		last_seen = conn.execute('SELECT max(utcTime) FROM tasks WHERE runId = ?', (run_id,)).fetchone()[0]
+
+		conn.execute(
+			'INSERT INTO pipelines (name, n_runs, last_seen) VALUES (?, 1, ?) '
+			'ON CONFLICT (name) DO UPDATE SET n_runs = n_runs + 1, last_seen = '
+			'CASE WHEN last_seen IS NULL OR excluded.last_seen > last_seen THEN excluded.last_seen ELSE last_seen END',
+			(pipeline, last_seen))
+
+		for (doc,) in conn.execute("SELECT doc FROM tasks WHERE runId = ? AND event = 'process_completed'", (run_id,)).fetchall():
+			task = pickle.loads(doc)
+			if task['_id'] in pending:
+				continue
+
+			self._process_add(conn, pipeline, task)
+
+		return True
+
+	def _process_add(self, conn, pipeline, task):
+		# catalogue the process of a completed task, if the task names it
+		if task_process(task) == None:
+			return
+
+		conn.execute('INSERT OR IGNORE INTO pipeline_processes (name, process) VALUES (?, ?)', (pipeline, task_process(task)))
+		self._stats_add(conn, pipeline, task)
+
+	def _stats_add(self, conn, pipeline, task):
+		# add the resource values of a completed task to the statistics of its process
+		process = task_process(task)
+		values = stats.trace_values(task['trace'])
+		if process == None or not values:
+			return
+
+		row = conn.execute('SELECT stats FROM process_stats WHERE name = ? AND process = ?', (pipeline, process)).fetchone()
+		entry = pickle.loads(row[0]) if row != None else {}
+		stats.add(entry, values)
+
+		conn.execute('INSERT OR REPLACE INTO process_stats (name, process, stats) VALUES (?, ?, ?)', (pipeline, process, pickle.dumps(entry)))
+
+	def _catalogue_update(self, conn, task, pending=()):
+		run_id = task.get('runId')
+
+		# map the run to its pipeline on the 'started' event of the run
+		if task.get('event') == 'started' and task_pipeline(task) != None and self._run_add(conn, run_id, task_pipeline(task), pending):
+			return
+
+		# update the catalogue entry of the pipeline of the run with the event
+		row = conn.execute('SELECT project_name FROM runs WHERE runId = ?', (run_id,)).fetchone()
+		if row == None:
+			return
+
+		if task.get('utcTime') != None:
+			conn.execute(
+				'UPDATE pipelines SET last_seen = ? WHERE name = ? AND (last_seen IS NULL OR last_seen < ?)',
+				(task['utcTime'], row[0], task['utcTime']))
+
+		if task.get('event') == 'process_completed':
+			self._process_add(conn, row[0], task)
 
 	async def task_create(self, task):
-		return await self._db.tasks.insert_one(task)
+		await self.task_create_many([task])
+
+	async def task_create_many(self, tasks):
+		rows = [self._task_row(t) for t in tasks]
+
+		def insert():
+			# insert all tasks and update the catalogue in the same transaction
+			with self._transaction() as conn:
+				conn.executemany('INSERT INTO tasks (_id, runId, event, utcTime, project_name, process, doc) VALUES (?, ?, ?, ?, ?, ?, ?)', rows)
+
+				pending = set(t['_id'] for t in tasks)
+				for task in tasks:
+					pending.discard(task['_id'])
+					self._catalogue_update(conn, task, pending)
+
+		await self._run(insert)
+
+	async def task_query_stats(self, pipeline):
+		def query():
+			rows = self._connection().execute('SELECT process, stats FROM process_stats WHERE name = ?', (pipeline,)).fetchall()
+			return {process: stats.summary(pickle.loads(entry)) for process, entry in rows}
+
+		return await self._run(query)
 
-	async def task_get(self, id):
-		return await self._db.tasks.find_one({ '_id': id })
+	async def task_get(self, id, fields=None):
+		return await self._fetch_one('SELECT doc FROM tasks WHERE _id = ?', (id,), 'Task was not found', fields)
 
 
 
@@ -0,0 +1,437 @@
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+
+import bson
+import motor.motor_tornado
+
+import backend
+import stats
+
+
+
+#-------------------------------------
+# Backends
+#-------------------------------------
+
+def create_file_backend(workdir, journal=False):
+	return backend.FileBackend(os.path.join(workdir, 'db.pkl'), journal=journal)
+
+
+
+def create_sqlite_backend(workdir):
+	return backend.SqliteBackend(os.path.join(workdir, 'db.sqlite'))
+
+
+
+class BenchmarkMongoBackend(backend.MongoBackend):
+
+	# mongo backend on a database of its own, dropped at the end of the benchmark
+
+	UNSUPPORTED = {}
+
+	def __init__(self, url):
+		self._database = 'benchmark_%s' % new_id()
+		super().__init__(url)
+
+	def initialize(self):
+		self._client = motor.motor_tornado.MotorClient(self._url)
+		self._db = self._client[self._database]
+
+	async def drop(self):
+		await self._client.drop_database(self._database)
+		self.close()
+
+
+
+def create_mongo_backend(url=None):
+	# measure a mongo server if its url is given
+	if url != None:
+		return BenchmarkMongoBackend(url)
+
+	# otherwise replace the mongo service with an in-process stand-in
+	import mongomock_motor
+
+	class MockMongoBackend(BenchmarkMongoBackend):
+
+		# functions the stand-in can't run, left out of the results instead of
+		# counting their calls as errors; the tasks are saved by seed() instead
+		UNSUPPORTED = {
+			'startup': 'the $merge aggregation stage is not implemented by the stand-in',
+			'task_create': 'bulk_write() of the stand-in does not support the installed pymongo',
+			'task_create_many': 'bulk_write() of the stand-in does not support the installed pymongo',
+			'task_query_pipeline': 'the $lookup stage with a pipeline is not implemented by the stand-in',
+			'task_iter_pipeline': 'the $lookup stage with a pipeline is not implemented by the stand-in'
+		}
+
+		def initialize(self):
+			self._client = mongomock_motor.AsyncMongoMockClient()
+			self._db = self._client[self._database]
+
+		async def seed(self, events):
+			# save the events and build their catalogue with single inserts, so
+			# the reads of the tasks can be measured
+			await self._db.tasks.insert_many(events)
+
+			runs = {e['runId']: backend.task_pipeline(e) for e in events if e['event'] == 'started'}
+			pipelines = {}
+			entries = {}
+
+			for e in events:
+				pipeline = runs.get(e['runId'])
+				if e['event'] == 'process_completed':
+					entry = entries.setdefault((pipeline, backend.task_process(e)), { 'last_seen': None, 'metrics': {} })
+					entry['last_seen'] = backend.max_time(entry['last_seen'], e['utcTime'])
+					stats.add(entry['metrics'], stats.trace_values(e['trace']))
+				else:
+					p = pipelines.setdefault(pipeline, { '_id': pipeline, 'n_runs': 0, 'last_seen': None })
+					p['last_seen'] = backend.max_time(p['last_seen'], e['utcTime'])
+					p['n_runs'] += e['event'] == 'started'
+
+			await self._db.runs.insert_many([{ '_id': r, 'projectName': p } for r, p in runs.items()])
+			await self._db.pipelines.insert_many(list(pipelines.values()))
+			await self._db.process_stats.insert_many([{ 'pipeline': p, 'process': process, **entry } for (p, process), entry in entries.items()])
+
+	return MockMongoBackend(None)
+
+
+
+BACKENDS = {
+	'file': lambda workdir, args: create_file_backend(workdir),
+	'file-journal': lambda workdir, args: create_file_backend(workdir, journal=True),
+	'sqlite': lambda workdir, args: create_sqlite_backend(workdir),
+	'mongo': lambda workdir, args: create_mongo_backend(args.mongo_url)
+}
+
+
+
+#-------------------------------------
+# Synthetic data
+#-------------------------------------
+
+def new_id():
+	return str(bson.ObjectId())
+
+
+
+def utc_time(t):
+	return datetime.datetime.fromtimestamp(t, datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+
+def make_user(i):
+	return {
+		'_id': new_id(),
+		'username': 'user%06d' % i,
+		'password': b'$2b$12$' + b'x' * 53,
+		'role': 'guest',
+		'date_created': int(time.time() * 1000)
+	}
+
+
+
+def make_dataset(i, user):
+	return {
+		'_id': new_id(),
+		'user_id': user['_id'],
+		'name': 'dataset-%06d' % i,
+		'author': user['username'],
+		'description': 'synthetic dataset',
+		'n_files': 0,
+		'date_created': int(time.time() * 1000)
+	}
+
+
+
+def make_workflow(i, user):
+	return {
+		'_id': new_id(),
+		'user_id': user['_id'],
+		'name': 'workflow-%06d' % i,
+		'pipeline': 'nf-core/pipeline%d' % (i % 10),
+		'author': user['username'],
+		'description': 'synthetic workflow',
+		'revision': 'main',
+		'profiles': 'guest',
+		'status': 'nascent',
+		'pid': -1,
+		'n_attempts': 0,
+		'attempts': [],
+		'date_created': int(time.time() * 1000)
+	}
+
+
+
+def make_attempt(workflow, n_attempt):
+	return {
+		'id': n_attempt,
+		'description': 'attempt %d' % n_attempt,
+		'inputs': [],
+		'date_submitted': int(time.time() * 1000),
+		'status': 'running',
+		'output_dir': os.path.join(workflow['_id'], str(n_attempt))
+	}
+
+
+
+def make_run(rng, pipeline, n_processes, n_tasks, t0):
+	# generate the weblog events of a nextflow run: started, one event per task and completed
+	run_id = new_id()
+	run_name = 'run_%s' % run_id[-6:]
+	events = [{
+		'_id': new_id(),
+		'runId': run_id,
+		'runName': run_name,
+		'event': 'started',
+		'utcTime': utc_time(t0),
+		'metadata': { 'workflow': { 'projectName': pipeline, 'runName': run_name } }
+	}]
+
+	for i in range(n_tasks):
+		process = 'PROCESS_%d' % (i % n_processes)
+		events.append({
+			'_id': new_id(),
+			'runId': run_id,
+			'runName': run_name,
+			'event': 'process_completed',
+			'utcTime': utc_time(t0 + i + 1),
+			'trace': {
+				'task_id': i + 1,
+				'process': process,
+				'name': '%s (%d)' % (process, i + 1),
+				'status': 'COMPLETED',
+				'exit': 0,
+				'workdir': '/workspace/work/%s' % new_id(),
+				'realtime': rng.randint(1000, 600000),
+				'%cpu': round(rng.uniform(1, 800), 1),
+				'peak_rss': rng.randint(2 ** 20, 2 ** 34),
+				'read_bytes': rng.randint(0, 2 ** 32),
+				'write_bytes': rng.randint(0, 2 ** 32)
+			}
+		})
+
+	events.append({
+		'_id': new_id(),
+		'runId': run_id,
+		'runName': run_name,
+		'event': 'completed',
+		'utcTime': utc_time(t0 + n_tasks + 1),
+		'metadata': { 'workflow': { 'projectName': pipeline, 'runName': run_name, 'success': True } }
+	})
+
+	return events
+
+
+
+#-------------------------------------
+# Measurements
+#-------------------------------------
+
+class Recorder():
+
+	def __init__(self, unsupported={}):
+		self.results = {}
+		self.unsupported = unsupported
+
+	async def measure(self, method, calls):
+		# record why a function the backend can't run is left out
+		if method in self.unsupported:
+			self.results[method] = { 'skipped': self.unsupported[method] }
+			return
+
+		# run each call in turn and record its latency
+		latencies = []
+		errors = 0
+		error = None
+		start = time.perf_counter()
+
+		for call in calls:
+			t = time.perf_counter()
+			try:
+				await call()
+				latencies.append(time.perf_counter() - t)
+			except Exception as e:
+				errors += 1
+				error = error or '%s: %s' % (type(e).__name__, e)
+
+		elapsed = time.perf_counter() - start
+		latencies.sort()
+
+		self.results[method] = {
+			'calls': len(latencies),
+			'errors': errors,
+			'elapsed_s': elapsed,
+			'throughput': len(latencies) / elapsed if latencies and elapsed > 0 else 0,
+			'p50_ms': percentile(latencies, 50) * 1000,
+			'p99_ms': percentile(latencies, 99) * 1000
+		}
+
+		if error:
+			self.results[method]['error'] = error
+
+
+
+def percentile(values, p):
+	# nearest-rank percentile of sorted values
+	if not values:
+		return 0
+
+	return values[min(len(values) - 1, max(0, int(round(p / 100 * len(values) + 0.5)) - 1))]
+
+
+
+async def query_all(query, page_size):
+	# read every page of a list query by following its cursor
+	cursor = None
+	while True:
+		docs = await query(0, page_size, cursor)
+		if len(docs) < page_size:
+			return
+
+		# the backends take the decoded cursor, the (order value, id) of the last document
+		order_key = 'date_created' if 'date_created' in docs[-1] else 'utcTime'
+		cursor = (docs[-1][order_key], docs[-1]['_id'])
+
+
+
+#-------------------------------------
+# Workload
+#-------------------------------------
+
+async def run_workload(db, args):
+	rng = random.Random(args.seed)
+	recorder = Recorder(getattr(db, 'UNSUPPORTED', {}))
+
+	await recorder.measure('startup', [db.startup])
+
+	# users
+	users = [make_user(i) for i in range(args.users)]
+
+	await recorder.measure('user_create', [lambda u=u: db.user_create(u) for u in users])
+	await recorder.measure('user_get', [lambda u=u: db.user_get(u['username']) for u in rng.choices(users, k=args.reads)])
+	await recorder.measure('user_query', [lambda: query_all(db.user_query, args.page_size)])
+
+	# datasets
+	datasets = [make_dataset(i, rng.choice(users)) for i in range(args.datasets)]
+
+	await recorder.measure('dataset_create', [lambda d=d: db.dataset_create(d) for d in datasets])
+	await recorder.measure('dataset_get', [lambda d=d: db.dataset_get(d['_id']) for d in rng.choices(datasets, k=args.reads)])
+	await recorder.measure('dataset_query', [lambda u=u: db.dataset_query(u['_id'], 0, args.page_size) for u in rng.choices(users, k=args.reads)])
+	await recorder.measure('dataset_update', [lambda d=d: db.dataset_update(d['_id'], {**d, 'n_files': 1}) for d in rng.choices(datasets, k=args.reads)])
+
+	# workflows with many attempts
+	workflows = [make_workflow(i, rng.choice(users)) for i in range(args.workflows)]
+	attempts = [(w, n) for n in range(1, args.attempts + 1) for w in workflows]
+
+	await recorder.measure('workflow_create', [lambda w=w: db.workflow_create(w) for w in workflows])
+	await recorder.measure('attempt_create', [lambda w=w, n=n: db.attempt_create(w['_id'], make_attempt(w, n), { 'status': 'running', 'n_attempts': n }) for w, n in attempts])
+	await recorder.measure('attempt_set_fields', [lambda w=w, n=n: db.attempt_set_fields(w['_id'], n - 1, { 'status': 'completed' }) for w, n in attempts])
+	await recorder.measure('workflow_set_fields', [lambda w=w: db.workflow_set_fields(w['_id'], { 'status': 'completed', 'pid': -1 }) for w in workflows])
+	await recorder.measure('workflow_get', [lambda w=w: db.workflow_get(w['_id']) for w in rng.choices(workflows, k=args.reads)])
+	await recorder.measure('workflow_query', [lambda u=u: db.workflow_query(u['_id'], 0, args.page_size) for u in rng.choices(users, k=args.reads)])
+
+	# nextflow weblog events
+	pipelines = ['nf-core/pipeline%d' % i for i in range(args.pipelines)]
+	runs = [make_run(rng, rng.choice(pipelines), args.processes, args.tasks_per_run, i * 86400) for i in range(args.runs)]
+	events = [e for run in runs for e in run]
+	n_single = len(events) // 10
+	batches = [events[i:i + args.batch_size] for i in range(n_single, len(events), args.batch_size)]
+
+	await recorder.measure('task_create', [lambda e=e: db.task_create(e) for e in events[:n_single]])
+	await recorder.measure('task_create_many', [lambda b=b: db.task_create_many(b) for b in batches])
+
+	# save the events directly if the backend can't run the functions that save them
+	if 'task_create' in recorder.unsupported:
+		await db.seed(events)
+
+	await recorder.measure('task_get', [lambda e=e: db.task_get(e['_id']) for e in rng.choices(events, k=args.reads)])
+	await recorder.measure('task_query', [lambda: query_all(db.task_query, args.page_size)])
+	await recorder.measure('task_query_pipelines', [lambda: db.task_query_pipelines(details=True) for _ in range(args.reads)])
+	await recorder.measure('task_query_pipeline', [lambda p=p: db.task_query_pipeline(p) for p in pipelines])
+	await recorder.measure('task_query_stats', [lambda p=p: db.task_query_stats(p) for p in pipelines])
+
+	async def iter_pipeline(pipeline):
+		async for _ in db.task_iter_pipeline(pipeline):
+			pass
+
+	await recorder.measure('task_iter_pipeline', [lambda p=p: iter_pipeline(p) for p in pipelines])
+
+	# deletes
+	await recorder.measure('workflow_delete', [lambda w=w: db.workflow_delete(w['_id']) for w in workflows])
+	await recorder.measure('dataset_delete', [lambda d=d: db.dataset_delete(d['_id']) for d in datasets])
+	await recorder.measure('user_delete', [lambda u=u: db.user_delete(u['_id']) for u in users])
+
+	return recorder.results
+
+
+
+async def main(args):
+	results = {
+		'date': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+		'config': vars(args),
+		'backends': {}
+	}
+
+	for name in args.backends:
+		workdir = tempfile.mkdtemp(prefix='benchmark-')
+		db = None
+		try:
+			try:
+				db = BACKENDS[name](workdir, args)
+			except ImportError as e:
+				print('** %s: skipped (%s)' % (name, e))
+				continue
+
+			print('** %s: running' % (name), flush=True)
+			results['backends'][name] = await run_workload(db, args)
+		finally:
+			# remove the files and the mongo database of the benchmark
+			if isinstance(db, BenchmarkMongoBackend):
+				await db.drop()
+			shutil.rmtree(workdir, ignore_errors=True)
+
+		for method, r in results['backends'][name].items():
+			if 'skipped' in r:
+				print('%-14s %-22s skipped: %s' % (name, method, r['skipped']))
+				continue
+
+			print('%-14s %-22s %8d calls %10.1f /s  p50 %9.3f ms  p99 %9.3f ms%s' % (
+				name, method, r['calls'], r['throughput'], r['p50_ms'], r['p99_ms'],
+				'  (%d errors)' % r['errors'] if r['errors'] else ''))
+
+	# save results
+	with open(args.output, 'w') as f:
+		json.dump(results, f, indent=2)
+
+	print('** results saved to %s' % (args.output))
+
+
+
+if __name__ == '__main__':
+	# parse command-line arguments
+	parser = argparse.ArgumentParser(description='Measure the throughput and latency of the database backends on a synthetic workload')
+	parser.add_argument('--backends', nargs='+', default=list(BACKENDS), choices=list(BACKENDS), help='backends to measure')
+	parser.add_argument('--users', type=int, default=100, help='number of users')
+	parser.add_argument('--datasets', type=int, default=200, help='number of datasets')
+	parser.add_argument('--workflows', type=int, default=200, help='number of workflows')
+	parser.add_argument('--attempts', type=int, default=10, help='number of attempts of each workflow')
+	parser.add_argument('--pipelines', type=int, default=5, help='number of pipelines')
+	parser.add_argument('--runs', type=int, default=20, help='number of nextflow runs')
+	parser.add_argument('--processes', type=int, default=8, help='number of processes of each run')
+	parser.add_argument('--tasks-per-run', type=int, default=200, help='number of tasks of each run')
+	parser.add_argument('--batch-size', type=int, default=100, help='number of task events saved by each task_create_many call')
+	parser.add_argument('--reads', type=int, default=200, help='number of calls of each read method')
+	parser.add_argument('--page-size', type=int, default=100, help='page size of the list queries')
+	parser.add_argument('--seed', type=int, default=0, help='random seed of the workload')
+	parser.add_argument('--mongo-url', help='url of a mongo server to measure the mongo backend on, instead of an in-process stand-in')
+	parser.add_argument('--output', default='benchmark.json', help='output file of the results (JSON)')
+
+	args = parser.parse_args()
+
+	asyncio.run(main(args))
@@ -63,6 +63,14 @@ SHARED_VOLUMES = os.environ.get('SHARED_VOLUMES')
 
 
 
+# Request body section -----
+# maximum size of the dataset uploads written to disk as they are received
+UPLOAD_MAX_SIZE = int(os.environ.get('UPLOAD_MAX_SIZE', 1024 ** 4))
+# resumable uploads that receive no data for this long are canceled (7 days)
+UPLOAD_EXPIRE_SECONDS = int(os.environ.get('UPLOAD_EXPIRE_SECONDS', 7 * 24 * 3600))
+
+
+
 # MongoDB section -----
 MONGODB_DB = os.environ.get('MONGODB_DB')
 
@@ -79,6 +87,14 @@ PWD_GUEST = os.environ.get('PWD_GUEST', 'guest')
 # admin user
 USER_ADMIN = os.environ.get('USER_ADMIN', 'admin')
 PWD_ADMIN = os.environ.get('PWD_ADMIN', 'admin')
+# cache of the user records checked by the authorization
+USER_CACHE_TTL_SECONDS = int(os.environ.get('USER_CACHE_TTL_SECONDS', 60))
+USER_CACHE_SIZE = int(os.environ.get('USER_CACHE_SIZE', 1024))
+# cache of the tokens already verified
+TOKEN_CACHE_SIZE = int(os.environ.get('TOKEN_CACHE_SIZE', 4096))
+# threads hashing and checking passwords, and requests allowed to wait for them
+PASSWORD_WORKERS = int(os.environ.get('PASSWORD_WORKERS', 2))
+PASSWORD_QUEUE_SIZE = int(os.environ.get('PASSWORD_QUEUE_SIZE', 64))
 
 
 
@@ -10,8 +10,12 @@ if len(sys.argv) != 2:
 # get input rguments
 pkl_file = sys.argv[1]
 
-# print pkl file
+# print pkl file (snapshots and journals hold several pickled objects)
 with open(pkl_file, 'rb') as f:
-    data = pickle.load(f)
-pprint.pprint(data, indent=1)
+    while True:
+        try:
+            data = pickle.load(f)
+        except EOFError:
+            break
+        pprint.pprint(data, indent=1)
 #print(json.dumps(data, indent=4))
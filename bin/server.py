@@ -1,7 +1,12 @@
 #!/usr/bin/env python3
 
+import asyncio
 import base64
 import bson
+import collections
+import concurrent.futures
+import csv
+import hashlib
 import json
 import multiprocessing as mp
 import os
@@ -9,6 +14,7 @@ import pandas as pd
 import shutil
 import socket
 import subprocess
+import threading
 import time
 import tornado
 import tornado.escape
@@ -27,6 +33,7 @@ import datetime
 
 import backend
 import env
+import upload
 # import model as Model
 import visualizer as Visualizer
 import workflow as Workflow
@@ -46,6 +53,38 @@ def message(status, message):
 		'message': message
 	}
 
+#
+# Read the cursor of a paginated query sorted by order_key, if the request has one
+#
+def get_cursor(handler, order_key):
+	cursor = handler.get_query_argument('cursor', None)
+	if not cursor:
+		return None
+
+	try:
+		return backend.decode_cursor(cursor, order_key)
+	except ValueError:
+		raise tornado.web.HTTPError(400, 'Invalid cursor')
+
+#
+# Read the comma-separated fields to return from a query, keeping the sort key
+# of the documents so their cursor can be built
+#
+def get_fields(handler, order_key):
+	fields = handler.get_query_argument('fields', None)
+	if not fields:
+		return None
+
+	return [order_key] + [f.strip() for f in fields.split(',') if f.strip()]
+
+#
+# Return the cursor of the next page in a header, so the response body stays a list,
+# unless the page ends with the documents without sort key, which are sorted last
+#
+def set_next_cursor(handler, docs, page_size, order_key):
+	if docs and len(docs) == page_size and docs[-1].get(order_key) != None:
+		handler.set_header('X-Next-Cursor', backend.encode_cursor(docs[-1], order_key))
+
 #
 # Function to handle and print unhandled exceptions
 #
@@ -245,6 +284,7 @@ class CORSMixin:
 				self.set_header("Access-Control-Allow-Origin", origin)
 		self.set_header("Access-Control-Allow-Headers", "x-requested-with, content-type")
 		self.set_header("Access-Control-Allow-Methods", "POST, GET, OPTIONS, DELETE, PUT")
+		self.set_header("Access-Control-Expose-Headers", "X-Next-Cursor")
 
 	def options(self, *args, **kwargs):
 		self.set_status(204)
@@ -262,9 +302,10 @@ class CORSAuthMixin(tornado.web.RequestHandler):
 			origin = self.request.headers.get("Origin")
 			if origin in env.CORS_HOSTS:
 					self.set_header("Access-Control-Allow-Origin", origin)
-			self.set_header("Access-Control-Allow-Headers", "x-requested-with, content-type, Authorization")
+			self.set_header("Access-Control-Allow-Headers", "x-requested-with, content-type, Authorization, Upload-Offset")
 			self.set_header("Access-Control-Allow-Methods", "POST, GET, OPTIONS, DELETE, PUT")
 			self.set_header("Access-Control-Allow-Credentials", "true")
+			self.set_header("Access-Control-Expose-Headers", "X-Next-Cursor, Upload-Offset")
 
 	def options(self, *args, **kwargs):
 		self.set_status(204)
@@ -281,7 +322,7 @@ class CORSAuthMixin(tornado.web.RequestHandler):
 		if 'Authorization' not in self.request.headers:
 			raise tornado.web.HTTPError(401, 'Missing authorization header')		
 		token = self.request.headers['Authorization'].split(' ')[-1]
-		payload = jwt_decode(token)
+		payload = token_cache.decode(token)
 		self.current_user = payload
 
 
@@ -291,6 +332,77 @@ class CORSAuthMixin(tornado.web.RequestHandler):
 # LOGIN Function and Class
 #-------------------------------------
 
+#
+# Hash and check passwords on a few threads out of the event loop, since
+# bcrypt takes a few hundred milliseconds of CPU per call. The requests
+# beyond the threads wait in a bounded queue and the next ones are refused,
+# so a burst of logins can't stall the server nor pile up without limit.
+#
+class PasswordBusyError(Exception):
+	pass
+
+
+class PasswordHasher():
+
+	def __init__(self, max_workers, max_queue):
+		self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='password')
+		self._max_workers = max_workers
+		self._max_queue = max_queue
+		self._lock = threading.Lock()
+		self._running = 0
+		self._pending = 0
+		self.completed = 0
+		self.rejected = 0
+		self.max_queued = 0
+		self.wait_time = 0.0
+
+	async def _run(self, fn, *args):
+		# refuse the request when every thread is busy and the queue is full
+		if self._pending >= self._max_workers + self._max_queue:
+			self.rejected += 1
+			raise PasswordBusyError('Too many password requests')
+
+		self._pending += 1
+		self.max_queued = max(self.max_queued, self._pending - self._max_workers)
+		submitted = time.monotonic()
+
+		def run():
+			with self._lock:
+				self.wait_time += time.monotonic() - submitted
+				self._running += 1
+			try:
+				return fn(*args)
+			finally:
+				with self._lock:
+					self._running -= 1
+
+		try:
+			return await asyncio.get_running_loop().run_in_executor(self._executor, run)
+		finally:
+			self._pending -= 1
+			self.completed += 1
+
+	async def hash(self, password):
+		return await self._run(lambda: bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()))
+
+	async def check(self, password, password_hash):
+		return await self._run(lambda: bcrypt.checkpw(password.encode('utf-8'), password_hash))
+
+	def metrics(self):
+		return {
+			'workers': self._max_workers,
+			'max_queue': self._max_queue,
+			'running': self._running,
+			'queued': max(self._pending - self._max_workers, 0),
+			'max_queued': self.max_queued,
+			'completed': self.completed,
+			'rejected': self.rejected,
+			'wait_ms_avg': self.wait_time / self.completed * 1000 if self.completed else 0
+		}
+
+
+password_hasher = PasswordHasher(env.PASSWORD_WORKERS, env.PASSWORD_QUEUE_SIZE)
+
 #
 # Create user
 #
@@ -298,7 +410,9 @@ async def create_user(db, username, password, role='guest'):
 
 	# encode pwd
 	try:
-		password_hash = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
+		password_hash = await password_hasher.hash(password)
+	except PasswordBusyError:
+		raise
 	except Exception as e:
 		raise KeyError('Encoding pwd')
 
@@ -322,13 +436,65 @@ async def create_user(db, username, password, role='guest'):
 
 	return user
 
+#
+# Cache of the user records checked by the authorization, so a request
+# doesn't read the user from the database each time. The entries of a user
+# are invalidated when it is updated or deleted by this process and expire
+# after a few seconds for the changes made by the other server processes.
+#
+class UserCache():
+
+	def __init__(self, ttl, max_size):
+		self._ttl = ttl
+		self._max_size = max_size
+		self._users = collections.OrderedDict()
+		self.hits = 0
+		self.misses = 0
+
+	async def get(self, db, username):
+		# return the cached user if it hasn't expired
+		entry = self._users.get(username)
+		if entry != None and entry[0] > time.monotonic():
+			self._users.move_to_end(username)
+			self.hits += 1
+			return entry[1]
+
+		self.misses += 1
+
+		# read the user, only the fields used by the authorization are kept
+		user = await db.user_get(username)
+		user = { '_id': user['_id'], 'username': user['username'], 'role': user.get('role') }
+
+		self._users[username] = (time.monotonic() + self._ttl, user)
+		self._users.move_to_end(username)
+
+		# evict the least recently used users
+		while len(self._users) > self._max_size:
+			self._users.popitem(last=False)
+
+		return user
+
+	def invalidate(self, username):
+		self._users.pop(username, None)
+
+	def metrics(self):
+		return { 'size': len(self._users), 'max_size': self._max_size, 'hits': self.hits, 'misses': self.misses }
+
+
+user_cache = UserCache(env.USER_CACHE_TTL_SECONDS, env.USER_CACHE_SIZE)
+
 #
 # Check if the user is admin or not
 #
 async def is_admin(db, user):
+		# the role claim of the verified token decides, other users never read the database
+		if user.get('role') != 'admin':
+			return False
+
+		# make sure the user still exists and is still admin, the token may be older than a change
 		try:
-			admin = await db.user_get('admin')
-			return user['_id'] == admin['_id']
+			record = await user_cache.get(db, user['username'])
+			return record['_id'] == user['_id'] and record['role'] == 'admin'
 		except Exception as e:
 			return False
 
@@ -343,6 +509,47 @@ def jwt_decode(token):
 	except (jwt.ExpiredSignatureError, jwt.InvalidTokenError):
 		raise tornado.web.HTTPError(401, 'Invalid token')
 
+#
+# Cache of the tokens already verified, so the signature of a token is
+# checked once instead of on every request. Each entry expires with its
+# token and the least recently used ones are evicted when the cache is full.
+#
+class TokenCache():
+
+	def __init__(self, max_size):
+		self._max_size = max_size
+		self._tokens = collections.OrderedDict()
+		self.hits = 0
+		self.misses = 0
+
+	def decode(self, token):
+		# return the payload of the token if it was verified and hasn't expired
+		entry = self._tokens.get(token)
+		if entry != None and entry[0] > time.time():
+			self._tokens.move_to_end(token)
+			self.hits += 1
+			return dict(entry[1])
+
+		self.misses += 1
+		self._tokens.pop(token, None)
+
+		# verify the token, invalid tokens raise an error and are never cached
+		payload = jwt_decode(token)
+
+		self._tokens[token] = (payload['exp'], payload)
+
+		# evict the least recently used tokens
+		while len(self._tokens) > self._max_size:
+			self._tokens.popitem(last=False)
+
+		return dict(payload)
+
+	def metrics(self):
+		return { 'size': len(self._tokens), 'max_size': self._max_size, 'hits': self.hits, 'misses': self.misses }
+
+
+token_cache = TokenCache(env.TOKEN_CACHE_SIZE)
+
 #
 # Encode token (JWT)
 #
@@ -407,8 +614,17 @@ class LoginHandler(CORSMixin, tornado.web.RequestHandler):
 			self.write(message(500, f'Failed to login user: {str(e)}'))
 			return
 		
+		# check password
+		try:
+			valid = user and await password_hasher.check(password, user['password'])
+		except PasswordBusyError as e:
+			self.set_status(503)
+			self.set_header('Retry-After', 1)
+			self.write(message(503, 'Failed to login user: %s' % str(e)))
+			return
+
 		# create jwt token
-		if user and bcrypt.checkpw(password.encode('utf-8'), user['password']):
+		if valid:
 			jwt_token = jwt_encode(user)
 			self.set_status(200)
 			self.write({'token': jwt_token})
@@ -464,6 +680,11 @@ class UserCreateHandler(CORSMixin, tornado.web.RequestHandler):
 		# create user
 		try:
 			user = await create_user(db, username, password)
+		except PasswordBusyError as e:
+			self.set_status(503)
+			self.set_header('Retry-After', 1)
+			self.write(message(503, f'Creating user: {str(e)}'))
+			return
 		except Exception as e:
 			log_exception(e)
 			self.set_status(500)
@@ -481,14 +702,17 @@ class UserQueryHandler(CORSAuthMixin, tornado.web.RequestHandler):
 	async def get(self):
 		page = int(self.get_query_argument('page', 0))
 		page_size = int(self.get_query_argument('page_size', 100))
+		cursor = get_cursor(self, 'date_created')
+		fields = get_fields(self, 'date_created')
 
 		db = self.settings['db']
 
 		# return all users if user is admin
-		users = await db.user_query(page, page_size)
+		users = await db.user_query(page, page_size, cursor, fields)
+		set_next_cursor(self, users, page_size, 'date_created')
 
 		# don't display password field
-		users = [{**u, 'password': ''} for u in users]
+		users = [{**u, 'password': ''} if 'password' in u else u for u in users]
 
 		self.set_status(200)
 		self.set_header('content-type', 'application/json')
@@ -554,15 +778,21 @@ class UserEditHandler(CORSAuthMixin, tornado.web.RequestHandler):
 
 			# encode pwd
 			if 'password' in data:
-				password_hash = bcrypt.hashpw(user['password'].encode('utf-8'), bcrypt.gensalt())
+				password_hash = await password_hasher.hash(user['password'])
 				user['password'] = password_hash
 
 			# save user
 			await db.user_update(id, user)
+			user_cache.invalidate(username)
+			user_cache.invalidate(user['username'])
 
 			self.set_status(200)
 			self.set_header('content-type', 'application/json')
 			self.write(tornado.escape.json_encode({ '_id': id }))
+		except PasswordBusyError as e:
+			self.set_status(503)
+			self.set_header('Retry-After', 1)
+			self.write(message(503, 'Failed to update user \"%s\": %s' % (username, str(e))))
 		except Exception as e:
 			log_exception(e)
 			self.set_status(404)
@@ -579,6 +809,7 @@ class UserEditHandler(CORSAuthMixin, tornado.web.RequestHandler):
 
 			# delete user
 			await db.user_delete(id)
+			user_cache.invalidate(username)
 
 			self.set_status(200)
 			self.write(message(200, 'User \"%s\" was deleted' % username))
@@ -598,14 +829,17 @@ class DatasetQueryHandler(CORSAuthMixin, tornado.web.RequestHandler):
 	async def get(self):
 		page = int(self.get_query_argument('page', 0))
 		page_size = int(self.get_query_argument('page_size', 100))
+		cursor = get_cursor(self, 'date_created')
+		fields = get_fields(self, 'date_created')
 
 		db = self.settings['db']
 
 		# return all datasets if user is admin
 		if await is_admin(db, self.current_user):
-			datasets = await db.dataset_query('admin', page, page_size)
+			datasets = await db.dataset_query('admin', page, page_size, cursor, fields)
 		else:
-			datasets = await db.dataset_query(self.current_user['_id'], page, page_size)
+			datasets = await db.dataset_query(self.current_user['_id'], page, page_size, cursor, fields)
+		set_next_cursor(self, datasets, page_size, 'date_created')
 
 		self.set_status(200)
 		self.set_header('content-type', 'application/json')
@@ -779,97 +1013,421 @@ class DatasetEditHandler(CORSAuthMixin, tornado.web.RequestHandler):
 
 
 
+@tornado.web.stream_request_body
 class DatasetUploadHandler(CORSAuthMixin, tornado.web.RequestHandler):
 
+	# the body is parsed and written to disk as it is received, so the
+	# memory used doesn't depend on the size of the uploaded files
+
+	FORMATS = ['directory-path', 'file-path']
+
+	_parser = None
+	_error = None
+
+	async def prepare(self):
+		super().prepare()
+
+		if self.request.method != 'POST':
+			return
+
+		id, format, parameter = self.path_args
+		self._files = []
+
+		# allow larger bodies than the ones held in memory
+		self.request.connection.set_max_body_size(env.UPLOAD_MAX_SIZE)
+
+		# determine which type of upload to do
+		if format not in self.FORMATS:
+			self.set_status(404)
+			self.finish(message(404, 'The \"%s\" value for the query is not correct. Try with ["directory-path","file-path"]' % format))
+			return
+
+		# make sure the dataset exists
+		try:
+			await self.settings['db'].dataset_get(id)
+		except Exception as e:
+			log_exception(e)
+			self.set_status(404)
+			self.finish(message(404, 'Dataset \"%s\" was not found' % id))
+			return
+
+		# make sure request body contains files
+		content_type, params = upload.parse_header(self.request.headers.get('Content-Type', ''))
+		if content_type != 'multipart/form-data' or not params.get('boundary'):
+			self.set_status(400)
+			self.finish(message(400, 'No files were uploaded'))
+			return
+
+		# initialize input directory, using the parameter 'directory-path' as subdirectory
+		if format == 'directory-path':
+			self._input_dir = os.path.join(env.DATASETS_DIR, id, parameter)
+		else:
+			self._input_dir = os.path.join(env.DATASETS_DIR, id)
+
+		os.makedirs(self._input_dir, exist_ok=True)
+
+		self._parser = upload.MultipartParser(params['boundary'].encode('utf-8'), self._open_part)
+
+	def _open_part(self, name, filename):
+		# ignore the form fields that are not files
+		if not filename:
+			return None
+
+		id, format, parameter = self.path_args
+
+		# get the filename, or rename it based on 'parameter' query 'file-path'
+		f = upload.FileSink(upload.target_path(os.path.join(env.DATASETS_DIR, id), format, parameter, filename))
+		self._files.append(f)
+		return f
+
+	def data_received(self, chunk):
+		if self._parser == None or self._error != None:
+			return
+
+		# keep the error of an invalid body to answer it once the body is read
+		try:
+			self._parser.feed(chunk)
+		except ValueError as e:
+			self._error = str(e)
+
+	def on_finish(self):
+		# remove the files of an incomplete upload
+		for f in getattr(self, '_files', []):
+			f.abort()
+
+	def on_connection_close(self):
+		self.on_finish()
+
 	@role_required([])
 	async def post(self, id, format, parameter):
 		db = self.settings['db']
 
-		# make sure request body contains files
-		files = self.request.files
+		try:
+			if self._error != None:
+				raise ValueError(self._error)
+
+			self._parser.close()
+		except ValueError as e:
+			self.set_status(400)
+			self.write(message(400, 'Invalid upload: %s' % str(e)))
+			return
 
-		if not files:
+		if not self._files:
 			self.set_status(400)
 			self.write(message(400, 'No files were uploaded'))
 			return
 
 		try:
-			# get dataset
+			# move the uploaded files to the input directory
+			for f in self._files:
+				f.commit()
+
+			filenames = [os.path.basename(f.path) for f in self._files]
+			self._files = []
+
+			# increase n_files of the current dataset
 			dataset = await db.dataset_get(id)
+			dataset['n_files'] += len(filenames)
+
+			# save dataset
+			await db.dataset_update(id, dataset)
+
+			self.set_status(200)
+			self.write(message(200, 'File \"%s\" was uploaded for dataset \"%s\" successfully' % (filenames, id)))
+		except Exception as e:
+			log_exception(e)
+			self.set_status(404)
+			self.write(message(404, 'Failed to upload the file for dataset \"%s\"' % id))
+
+
+
+
+#
+# Resumable uploads: a session is created for a file, its data is sent in
+# chunks with PUT requests at the offset reported by the session, and the
+# session is finalized, optionally with a checksum, to add the file to the
+# dataset like DatasetUploadHandler does
+#
+def get_upload_session(handler, id, upload_id):
+	# load the upload session of the current user
+	try:
+		session = upload.UploadSession.load(os.path.join(env.DATASETS_DIR, id), upload_id)
+	except IndexError:
+		raise tornado.web.HTTPError(404, reason='Upload \"%s\" was not found' % upload_id)
+
+	if session.state['user_id'] != handler.current_user['_id']:
+		raise tornado.web.HTTPError(403, 'Forbidden')
+
+	return session
+
+
+
+class DatasetUploadCreateHandler(CORSAuthMixin, tornado.web.RequestHandler):
+
+	REQUIRED_KEYS = set([
+		'filename'
+	])
+
+	@role_required([])
+	async def post(self, id, format, parameter):
+		db = self.settings['db']
+
+		# make sure request body is valid
+		try:
+			data = tornado.escape.json_decode(self.request.body)
+		except ValueError:
+			self.set_status(422)
+			self.write(message(422, 'Ill-formatted JSON'))
+			return
+
+		if not isinstance(data, dict):
+			self.set_status(422)
+			self.write(message(422, 'The request body must be a JSON object'))
+			return
+
+		missing_keys = self.REQUIRED_KEYS - data.keys()
+		if missing_keys:
+			self.set_status(400)
+			self.write(message(400, 'Missing required field(s): %s' % list(missing_keys)))
+			return
+
+		try:
+			# get dataset
+			await db.dataset_get(id)
 		except Exception as e:
 			log_exception(e)
 			self.set_status(404)
 			self.write(message(404, 'Dataset \"%s\" was not found' % id))
+			return
 
-		# determine which type of upload to do
-		if format == "directory-path":
-			try:
-				# initialize input directory using the parameter 'directory-path'
-				input_dir = os.path.join(env.DATASETS_DIR, id, parameter)
-				os.makedirs(input_dir, exist_ok=True)
-
-				# save uploaded files to input directory
-				filenames = []
-
-				for f_list in files.values():
-					for f_arg in f_list:
-						filename, body = f_arg['filename'], f_arg['body']
-						# get the filename
-						filename = os.path.basename(filename)
-						with open(os.path.join(input_dir, filename), 'wb') as f:
-							f.write(body)
-						filenames.append(filename)
-
-				# increase n_files
-				dataset['n_files'] += len(filenames)
-
-				# save dataset
-				await db.dataset_update(id, dataset)
-
-				self.set_status(200)
-				self.write(message(200, 'File \"%s\" was uploaded for dataset \"%s\" successfully' % (filenames, id)))
-			except Exception as e:
-				log_exception(e)
-				self.set_status(404)
-				self.write(message(404, 'Failed to upload the file for dataset \"%s\"' % id))
+		# cancel the abandoned uploads of the dataset
+		upload.UploadSession.expire(os.path.join(env.DATASETS_DIR, id), env.UPLOAD_EXPIRE_SECONDS)
 
-		# determine which type of upload to do
-		elif format == "file-path":
-			try:
-				# initialize input directory
-				input_dir = os.path.join(env.DATASETS_DIR, id)
-				os.makedirs(input_dir, exist_ok=True)
-
-				# save uploaded files to input directory
-				filenames = []
-
-				for f_list in files.values():
-					for f_arg in f_list:
-						filename, body = f_arg['filename'], f_arg['body']
-						# rename the filename based on 'parameter' query 'file-path'
-						filename = parameter + os.path.splitext(os.path.basename(filename))[1]
-						with open(os.path.join(input_dir, filename), 'wb') as f:
-							f.write(body)
-						filenames.append(filename)
-
-				# increase n_files
-				dataset['n_files'] += len(filenames)
-
-				# save dataset
-				await db.dataset_update(id, dataset)
-
-				self.set_status(200)
-				self.write(message(200, 'File \"%s\" was uploaded for dataset \"%s\" successfully' % (filenames, id)))
-			except Exception as e:
-				log_exception(e)
-				self.set_status(404)
-				self.write(message(404, 'Failed to upload the file for dataset \"%s\"' % id))
+		try:
+			# create the upload session
+			session = upload.UploadSession.create(
+				os.path.join(env.DATASETS_DIR, id),
+				str(bson.ObjectId()),
+				format,
+				parameter,
+				data['filename'],
+				data.get('size'),
+				self.current_user['_id'])
+		except ValueError as e:
+			self.set_status(400)
+			self.write(message(400, 'Failed to create the upload: %s' % str(e)))
+			return
 
-		# determine which type of upload to do
-		else:
+		self.set_status(201)
+		self.set_header('content-type', 'application/json')
+		self.set_header('Location', '/api/datasets/%s/uploads/%s' % (id, session.id))
+		self.set_header('Upload-Offset', 0)
+		self.write(tornado.escape.json_encode({ '_id': session.id, 'offset': 0 }))
+
+
+
+@tornado.web.stream_request_body
+class DatasetUploadChunkHandler(CORSAuthMixin, tornado.web.RequestHandler):
+
+	# the chunk of a PUT request is appended to the upload as it is received,
+	# so the bytes received before a dropped connection are kept
+
+	_file = None
+	_remaining = None
+	_exceeded = False
+
+	def prepare(self):
+		super().prepare()
+
+		if self.request.method != 'PUT':
+			return
+
+		id, upload_id = self.path_args
+		self._session = get_upload_session(self, id, upload_id)
+
+		# allow larger bodies than the ones held in memory
+		self.request.connection.set_max_body_size(env.UPLOAD_MAX_SIZE)
+
+		# make sure the chunk continues the upload
+		try:
+			offset = int(self.request.headers['Upload-Offset'])
+		except (KeyError, ValueError):
+			self.set_status(400)
+			self.finish(message(400, 'Missing or invalid Upload-Offset header'))
+			return
+
+		size = self._session.state['size']
+		length = int(self.request.headers.get('Content-Length', 0))
+		if size != None and offset + length > size:
+			self.set_status(413)
+			self.finish(message(413, 'The chunk exceeds the upload size of %d bytes' % size))
+			return
+
+		# a chunked body has no Content-Length, so its size is also checked as it is received
+		if size != None:
+			self._remaining = size - offset
+
+		try:
+			self._file = self._session.open(offset)
+		except IndexError:
 			self.set_status(404)
-			self.write(message(404, 'The \"%s\" value for the query is not correct. Try with ["directory-path","file-path"]' % format))
+			self.finish(message(404, 'Upload \"%s\" was not found' % upload_id))
+		except ValueError as e:
+			# report the offset to continue from, unless the upload was finalized meanwhile
+			self.set_status(409)
+			try:
+				self.set_header('Upload-Offset', self._session.offset)
+			except IndexError:
+				pass
+			self.finish(message(409, str(e)))
 
+	def data_received(self, chunk):
+		if self._file == None:
+			return
+
+		# keep only the bytes within the upload size
+		if self._remaining != None:
+			if len(chunk) > self._remaining:
+				chunk = chunk[:self._remaining]
+				self._exceeded = True
+			self._remaining -= len(chunk)
+
+		self._file.write(chunk)
+
+	def on_finish(self):
+		# keep the data received so far, the upload continues from its size
+		if self._file != None:
+			self._file.close()
+			self._file = None
+
+	def on_connection_close(self):
+		self.on_finish()
+
+	@role_required([])
+	async def get(self, id, upload_id):
+		# report the committed offset of the upload
+		session = get_upload_session(self, id, upload_id)
+
+		try:
+			status = session.status()
+		except IndexError:
+			raise tornado.web.HTTPError(404, reason='Upload \"%s\" was not found' % upload_id)
+
+		self.set_status(200)
+		self.set_header('content-type', 'application/json')
+		self.set_header('Upload-Offset', status['offset'])
+		self.write(tornado.escape.json_encode(status))
+
+	@role_required([])
+	async def put(self, id, upload_id):
+		# make sure the chunk is on disk before it is acknowledged, and report
+		# the offset while the upload is still locked
+		self._file.flush()
+		os.fsync(self._file.fileno())
+		offset = self._file.tell()
+		self.on_finish()
+
+		if self._exceeded:
+			self.set_status(413)
+			self.set_header('Upload-Offset', offset)
+			self.write(message(413, 'The chunk exceeds the upload size of %d bytes' % self._session.state['size']))
+			return
+
+		self.set_status(204)
+		self.set_header('Upload-Offset', offset)
+
+	@role_required([])
+	async def delete(self, id, upload_id):
+		# cancel the upload
+		session = get_upload_session(self, id, upload_id)
+
+		try:
+			session.delete()
+		except IndexError:
+			raise tornado.web.HTTPError(404, reason='Upload \"%s\" was not found' % upload_id)
+		except ValueError as e:
+			self.set_status(409)
+			self.write(message(409, str(e)))
+			return
+
+		self.set_status(200)
+		self.write(message(200, 'Upload \"%s\" was canceled' % upload_id))
+
+
+
+class DatasetUploadFinalizeHandler(CORSAuthMixin, tornado.web.RequestHandler):
+
+	@role_required([])
+	async def post(self, id, upload_id):
+		db = self.settings['db']
+		session = get_upload_session(self, id, upload_id)
+
+		# make sure request body is valid
+		try:
+			data = tornado.escape.json_decode(self.request.body) if self.request.body else {}
+		except ValueError:
+			self.set_status(422)
+			self.write(message(422, 'Ill-formatted JSON'))
+			return
+
+		if not isinstance(data, dict):
+			self.set_status(422)
+			self.write(message(422, 'The request body must be a JSON object'))
+			return
+
+		# lock the upload so no chunk is written while it is finalized
+		try:
+			f = session.open()
+		except IndexError:
+			raise tornado.web.HTTPError(404, reason='Upload \"%s\" was not found' % upload_id)
+		except ValueError as e:
+			self.set_status(409)
+			self.write(message(409, str(e)))
+			return
+
+		try:
+			# make sure every byte was received
+			if session.state['size'] != None and session.offset != session.state['size']:
+				self.set_status(409)
+				self.set_header('Upload-Offset', session.offset)
+				self.write(message(409, 'The upload is incomplete: %d of %d bytes' % (session.offset, session.state['size'])))
+				return
+
+			# verify the checksum, given as '<algorithm>:<hex digest>', on a separate thread
+			if data.get('checksum'):
+				algorithm, _, digest = str(data['checksum']).partition(':')
+				algorithm = algorithm.lower()
+
+				if algorithm not in hashlib.algorithms_guaranteed or not digest:
+					self.set_status(400)
+					self.write(message(400, 'Invalid checksum \"%s\"' % data['checksum']))
+					return
+
+				checksum = await asyncio.get_running_loop().run_in_executor(None, session.checksum, algorithm)
+				if checksum != digest.lower():
+					self.set_status(422)
+					self.write(message(422, 'Checksum mismatch: %s:%s' % (algorithm, checksum)))
+					return
+
+			# move the file to the dataset
+			path = session.commit()
+		finally:
+			f.close()
+
+		try:
+			# increase n_files
+			dataset = await db.dataset_get(id)
+			dataset['n_files'] += 1
+
+			# save dataset
+			await db.dataset_update(id, dataset)
+
+			self.set_status(200)
+			self.write(message(200, 'File \"%s\" was uploaded for dataset \"%s\" successfully' % (os.path.basename(path), id)))
+		except Exception as e:
+			log_exception(e)
+			self.set_status(404)
+			self.write(message(404, 'Failed to upload the file for dataset \"%s\"' % id))
 
 
 
@@ -1026,14 +1584,17 @@ class WorkflowQueryHandler(CORSAuthMixin, tornado.web.RequestHandler):
 	async def get(self):
 		page = int(self.get_query_argument('page', 0))
 		page_size = int(self.get_query_argument('page_size', 100))
+		cursor = get_cursor(self, 'date_created')
+		fields = get_fields(self, 'date_created')
 
 		db = self.settings['db']
 
 		# return all workflows if user is admin
 		if await is_admin(db, self.current_user):
-			workflows = await db.workflow_query('admin', page, page_size)
+			workflows = await db.workflow_query('admin', page, page_size, cursor, fields)
 		else:
-			workflows = await db.workflow_query(self.current_user['_id'], page, page_size)
+			workflows = await db.workflow_query(self.current_user['_id'], page, page_size, cursor, fields)
+		set_next_cursor(self, workflows, page_size, 'date_created')
 
 		self.set_status(200)
 		self.set_header('content-type', 'application/json')
@@ -1290,7 +1851,7 @@ class WorkflowLaunchHandler(CORSAuthMixin, tornado.web.RequestHandler):
 			}
 			workflow['attempts'].append(attempt)
 
-			await db.workflow_update(id, workflow)
+			await db.attempt_create(id, attempt, {'status': workflow['status'], 'n_attempts': workflow['n_attempts']})
 
 			# copy nextflow.config from nextflow configuration folder
 			os.makedirs(workflow_dir, exist_ok=True)
@@ -1343,12 +1904,8 @@ class WorkflowCancelHandler(CORSAuthMixin, tornado.web.RequestHandler):
 			# cancel workflow
 			Workflow.cancel(workflow)
 
-			# update workflow status
-			workflow['status'] = 'canceled'
-			workflow['attempts'][n_attempt]['status'] = 'canceled'
-			workflow['pid'] = -1
-
-			await db.workflow_update(id, workflow)
+			# update workflow status and its last attempt at once
+			await db.attempt_set_fields(id, n_attempt, {'status': 'canceled'}, workflow_fields={'status': 'canceled', 'pid': -1})
 
 			self.set_status(200)
 			self.write(message(200, 'Workflow \"%s\" was canceled' % id))
@@ -1633,14 +2190,55 @@ class VolumeQueryHandler(CORSAuthMixin, tornado.web.RequestHandler):
 # TASKS Classes
 #-------------------------------------
 
+#
+# Prepare a task event received from Nextflow to be saved
+#
+def prepare_task(task):
+	# make sure the task has the fields used to save and index it
+	if not isinstance(task, dict) or not all(isinstance(task.get(k), str) for k in ['event', 'runId', 'utcTime']):
+		raise ValueError('Task must have the fields "event", "runId" and "utcTime"')
+
+	if task['event'] == 'started' and backend.task_pipeline(task) == None:
+		raise ValueError('Started event must have the field "metadata.workflow.projectName"')
+
+	if task['event'] == 'process_completed' and (backend.task_process(task) == None or not isinstance(task['trace'].get('workdir'), str)):
+		raise ValueError('Completed process must have the fields "trace.process" and "trace.workdir"')
+
+	# append id to task
+	task['_id'] = str(bson.ObjectId())
+
+	# extract input features for task
+	if task['event'] == 'process_completed':
+		# load execution log
+		filenames = ['.command.log', '.command.out', '.command.err']
+		filenames = [os.path.join(task['trace']['workdir'], filename) for filename in filenames]
+		files = [open(filename) for filename in filenames if os.path.exists(filename)]
+		lines = [line.strip() for f in files for line in f]
+
+		# parse input features from trace directives
+		PREFIX = '#TRACE'
+		lines = [line[len(PREFIX):] for line in lines if line.startswith(PREFIX)]
+		items = [line.split('=') for line in lines]
+		conditions = {k.strip(): v.strip() for k, v in items}
+
+		# append input features to task trace
+		task['trace'] = {**task['trace'], **conditions}
+
+	return task
+
+
+
 class TaskQueryHandler(CORSMixin, tornado.web.RequestHandler):
 
 	async def get(self):
 		page = int(self.get_query_argument('page', 0))
 		page_size = int(self.get_query_argument('page_size', 100))
+		cursor = get_cursor(self, 'utcTime')
+		fields = get_fields(self, 'utcTime')
 
 		db = self.settings['db']
-		tasks = await db.task_query(page, page_size)
+		tasks = await db.task_query(page, page_size, cursor, fields)
+		set_next_cursor(self, tasks, page_size, 'utcTime')
 
 		self.set_status(200)
 		self.set_header('content-type', 'application/json')
@@ -1658,56 +2256,57 @@ class TaskQueryHandler(CORSMixin, tornado.web.RequestHandler):
 			return
 
 		try:
-			# append id to task
-			task['_id'] = str(bson.ObjectId())
-
-			# extract input features for task
-			if task['event'] == 'process_completed':
-				# load execution log
-				filenames = ['.command.log', '.command.out', '.command.err']
-				filenames = [os.path.join(task['trace']['workdir'], filename) for filename in filenames]
-				files = [open(filename) for filename in filenames if os.path.exists(filename)]
-				lines = [line.strip() for f in files for line in f]
+			# save task
+			task = prepare_task(task)
+			await db.task_create(task)
 
-				# parse input features from trace directives
-				PREFIX = '#TRACE'
-				lines = [line[len(PREFIX):] for line in lines if line.startswith(PREFIX)]
-				items = [line.split('=') for line in lines]
-				conditions = {k.strip(): v.strip() for k, v in items}
+			self.set_status(200)
+			self.set_header('content-type', 'application/json')
+			self.write(tornado.escape.json_encode({ '_id': task['_id'] }))
+		except ValueError as e:
+			self.set_status(422)
+			self.write(message(422, str(e)))
+		except Exception as e:
+			log_exception(e)
+			self.set_status(404)
+			self.write(message(404, 'Failed to save task'))
 
-				# append input features to task trace
-				task['trace'] = {**task['trace'], **conditions}
 
-			# save task
-			await db.task_create(task)
 
-			# update workflow status on completed event
-			if task['event'] == 'completed':
-				# get workflow
-				workflow_id = task['runName'].split('-')[1]
-				workflow = await db.workflow_get(workflow_id)
-				# get last attempt because has to be the running one
-				n_attempt = int(workflow['n_attempts'] - 1)
+class TaskBatchHandler(CORSMixin, tornado.web.RequestHandler):
 
-				# # update workflow status
-				# success = task['metadata']['workflow']['success']
-				# if success:
-				# 	workflow['status'] = 'completed'
-				# 	workflow['attempts'][n_attempt]['status'] = 'completed'
+	async def post(self):
+		db = self.settings['db']
 
-				# else:
-				# 	workflow['status'] = 'failed'
-				# 	workflow['attempts'][n_attempt]['status'] = 'failed'
+		# make sure request body is valid, either a JSON array or one JSON event per line,
+		# where a body that isn't UTF-8 raises a UnicodeDecodeError, which is a ValueError
+		try:
+			body = self.request.body.strip()
+			if body.startswith(b'['):
+				tasks = tornado.escape.json_decode(body)
+			else:
+				tasks = [tornado.escape.json_decode(line) for line in body.splitlines() if line.strip()]
+		except ValueError:
+			self.set_status(422)
+			self.write(message(422, 'Ill-formatted JSON'))
+			return
 
-				await db.workflow_update(workflow['_id'], workflow)
+		try:
+			# save all tasks at once
+			tasks = [prepare_task(task) for task in tasks]
+			if tasks:
+				await db.task_create_many(tasks)
 
 			self.set_status(200)
 			self.set_header('content-type', 'application/json')
-			self.write(tornado.escape.json_encode({ '_id': task['_id'] }))
+			self.write(tornado.escape.json_encode({ '_ids': [task['_id'] for task in tasks] }))
+		except ValueError as e:
+			self.set_status(422)
+			self.write(message(422, str(e)))
 		except Exception as e:
 			log_exception(e)
 			self.set_status(404)
-			self.write(message(404, 'Failed to save task'))
+			self.write(message(404, 'Failed to save tasks'))
 
 
 
@@ -1756,8 +2355,9 @@ class TaskQueryPipelinesHandler(CORSMixin, tornado.web.RequestHandler):
 		db = self.settings['db']
 
 		try:
-			# query pipelines from database
-			pipelines = await db.task_query_pipelines()
+			# query pipelines, or their run count, last event time and processes, from the pipeline catalogue
+			details = self.get_query_argument('details', '0') not in ['0', 'false']
+			pipelines = await db.task_query_pipelines(details)
 
 			self.set_status(200)
 			self.set_header('content-type', 'application/json')
@@ -1776,21 +2376,56 @@ class TaskQueryPipelineHandler(CORSMixin, tornado.web.RequestHandler):
 		db = self.settings['db']
 
 		try:
-			# query tasks from database
 			pipeline = pipeline.lower()
-			tasks = await db.task_query_pipeline(pipeline)
-			tasks = [task['trace'] for task in tasks]
 
-			# separate tasks into dataframes by process
-			process_names = list(set([task['process'] for task in tasks]))
-			dfs = {}
+			self.set_status(200)
+			self.set_header('content-type', 'application/json')
+
+			# read the tasks of the pipeline once, grouped by process, and write them
+			# as they are read so they are never all in memory
+			self.write('{')
+
+			current = None
+			n_tasks = 0
+			async for task in db.task_iter_pipeline(pipeline, by_process=True):
+				process = backend.task_process(task)
+				if process == None:
+					continue
+
+				# start the list of the next process
+				if process != current:
+					self.write('%s%s: [' % ('], ' if current != None else '', tornado.escape.json_encode(process)))
+					current = process
+					n_tasks = 0
+
+				self.write((', ' if n_tasks > 0 else '') + tornado.escape.json_encode(task['trace']))
+				n_tasks += 1
 
-			for process in process_names:
-				dfs[process] = [task for task in tasks if task['process'] == process]
+				if n_tasks % 1000 == 0:
+					await self.flush()
+
+			self.write(']}' if current != None else '}')
+		except Exception as e:
+			log_exception(e)
+			self.set_status(404)
+			self.write(message(404, 'Failed to perform query'))
+			raise e
+
+
+
+class TaskQueryStatsHandler(CORSMixin, tornado.web.RequestHandler):
+
+	async def get(self, pipeline):
+		db = self.settings['db']
+
+		try:
+			# query the resource statistics of each process of the pipeline, maintained as the tasks are saved
+			pipeline = pipeline.lower()
+			process_stats = await db.task_query_stats(pipeline)
 
 			self.set_status(200)
 			self.set_header('content-type', 'application/json')
-			self.write(tornado.escape.json_encode(dfs))
+			self.write(tornado.escape.json_encode(process_stats))
 		except Exception as e:
 			log_exception(e)
 			self.set_status(404)
@@ -1805,35 +2440,37 @@ class TaskArchiveHandler(CORSMixin, tornado.web.RequestHandler):
 		db = self.settings['db']
 
 		try:
-			# query tasks from database
+			# collect the columns of each process in the order they appear, reading the tasks as a stream
 			pipeline = pipeline.lower()
-			tasks = await db.task_query_pipeline(pipeline)
-			tasks = [task['trace'] for task in tasks]
-
-			# separate tasks into dataframes by process
-			process_names = list(set([task['process'] for task in tasks]))
-			dfs = {}
+			columns = {}
 
-			for process in process_names:
-				dfs[process] = pd.DataFrame([task for task in tasks if task['process'] == process])
+			async for task in db.task_iter_pipeline(pipeline):
+				if backend.task_process(task) != None:
+					columns.setdefault(backend.task_process(task), {}).update(dict.fromkeys(task['trace']))
 
-			# change to trace directory
-			os.chdir(env.TRACES_DIR)
+			process_names = list(columns)
+			files = ['trace.%s.txt' % (process) for process in process_names]
 
-			# save dataframes to csv files
-			for process in process_names:
-				filename = 'trace.%s.txt' % (process)
-				dfs[process].to_csv(filename, sep='\t', index=False)
+			# write the tasks to the csv file of their process in a second pass
+			outputs = [open(os.path.join(env.TRACES_DIR, f), 'w', newline='') for f in files]
+			try:
+				writers = {}
+				for process, output in zip(process_names, outputs):
+					writers[process] = csv.DictWriter(output, fieldnames=list(columns[process]), delimiter='\t', lineterminator='\n', extrasaction='ignore')
+					writers[process].writeheader()
+
+				async for task in db.task_iter_pipeline(pipeline):
+					if backend.task_process(task) in writers:
+						writers[backend.task_process(task)].writerow(task['trace'])
+			finally:
+				for output in outputs:
+					output.close()
 
 			# create zip archive of trace files
 			zipfile = 'trace.%s.zip' % (pipeline.replace('/', '__'))
-			files = ['trace.%s.txt' % (process) for process in process_names]
 
-			subprocess.run(['zip', zipfile] + files, check=True)
-			subprocess.run(['rm', '-f'] + files, check=True)
-
-			# return to working directory
-			os.chdir('..')
+			subprocess.run(['zip', zipfile] + files, check=True, cwd=env.TRACES_DIR)
+			subprocess.run(['rm', '-f'] + files, check=True, cwd=env.TRACES_DIR)
 
 			self.set_status(200)
 			self.write(message(200, 'Archive was created'))
@@ -1933,6 +2570,52 @@ class TaskEditHandler(CORSMixin, tornado.web.RequestHandler):
 
 
 
+#-------------------------------------
+# ADMIN Classes
+#-------------------------------------
+
+class AdminIndexesHandler(CORSAuthMixin, tornado.web.RequestHandler):
+
+	@role_required(['admin'])
+	async def get(self):
+		db = self.settings['db']
+
+		try:
+			# report the indexes of each collection and how often they are used
+			report = await db.index_report()
+
+			self.set_status(200)
+			self.set_header('content-type', 'application/json')
+			self.write(tornado.escape.json_encode(report))
+		except NotImplementedError:
+			self.set_status(404)
+			self.write(message(404, 'Index report is not available for this backend'))
+		except Exception as e:
+			log_exception(e)
+			self.set_status(404)
+			self.write(message(404, 'Failed to get index report'))
+
+
+
+class AdminMetricsHandler(CORSAuthMixin, tornado.web.RequestHandler):
+
+	@role_required(['admin'])
+	async def get(self):
+		# report the counters of the authorization caches and password threads of this server process
+		metrics = {
+			'pid': os.getpid(),
+			'token_cache': token_cache.metrics(),
+			'user_cache': user_cache.metrics(),
+			'password_hasher': password_hasher.metrics()
+		}
+
+		self.set_status(200)
+		self.set_header('content-type', 'application/json')
+		self.write(tornado.escape.json_encode(metrics))
+
+
+
+
 #-------------------------------------
 # MODEL Classes: NOT IMPLEMENTED!!
 #-------------------------------------
@@ -2063,8 +2746,13 @@ class ModelPredictHandler(CORSMixin, tornado.web.RequestHandler):
 if __name__ == '__main__':
 
 	# parse command-line options
-	tornado.options.define('backend', default='mongo', help='Database backend to use (file or mongo)')
+	tornado.options.define('backend', default='mongo', help='Database backend to use (file, sqlite or mongo)')
 	tornado.options.define('url-file', default='db.pkl', help='database file for file backend')
+	tornado.options.define('file-journal', default=False, help='keep the file backend in memory and append mutations to a journal')
+	tornado.options.define('file-compact-every', default=10000, help='number of journal records before compacting them into the database file')
+	tornado.options.define('file-batch-window', default=0, help='milliseconds the file backend waits to group writes into a single flush')
+	tornado.options.define('file-batch-size', default=1000, help='maximum number of writes grouped into a single flush of the file backend')
+	tornado.options.define('url-sqlite', default='db.sqlite', help='database file for sqlite backend')
 	tornado.options.define('url-mongo', default='localhost', help='mongodb service url for mongo backend')
 	tornado.options.define('np', default=1, help='number of server processes')
 	tornado.options.define('port', default=env.PORT_CORE)
@@ -2088,6 +2776,9 @@ if __name__ == '__main__':
 		(r'/api/datasets/0', DatasetCreateHandler),
 		(r'/api/datasets/([a-zA-Z0-9-]+)', DatasetEditHandler),
 		(r'/api/datasets/([a-zA-Z0-9-]+)/([a-zA-Z-]+)/([a-zA-Z0-9-_]+)/upload', DatasetUploadHandler),
+		(r'/api/datasets/([a-zA-Z0-9-]+)/([a-zA-Z-]+)/([a-zA-Z0-9-_]+)/uploads', DatasetUploadCreateHandler),
+		(r'/api/datasets/([a-zA-Z0-9-]+)/uploads/([a-zA-Z0-9]+)', DatasetUploadChunkHandler),
+		(r'/api/datasets/([a-zA-Z0-9-]+)/uploads/([a-zA-Z0-9]+)/finalize', DatasetUploadFinalizeHandler),
 		(r'/api/datasets/([a-zA-Z0-9-]+)/link', DatasetLinkHandler),
 		(r'/api/datasets/([a-zA-Z0-9-]+)/delete', DatasetDeleteHandler),
 
@@ -2107,38 +2798,64 @@ if __name__ == '__main__':
 		(r'/api/volumes/?(.*)', VolumeQueryHandler),
 
 		(r'/api/tasks', TaskQueryHandler),
+		(r'/api/tasks/batch', TaskBatchHandler),
 		(r'/api/tasks/([a-zA-Z0-9-]+)/log', TaskLogHandler),
 		(r'/api/tasks/pipelines', TaskQueryPipelinesHandler),
 		(r'/api/tasks/pipelines/(.+)', TaskQueryPipelineHandler),
+		(r'/api/tasks/stats/(.+)', TaskQueryStatsHandler),
 		(r'/api/tasks/archive/(.+)/download', TaskArchiveDownloadHandler, dict(path=env.TRACES_DIR)),
 		(r'/api/tasks/archive/(.+)', TaskArchiveHandler),
 		(r'/api/tasks/visualize', TaskVisualizeHandler),
 		(r'/api/tasks/([a-zA-Z0-9-]+)', TaskEditHandler),
 
+		(r'/api/admin/indexes', AdminIndexesHandler),
+		(r'/api/admin/metrics', AdminMetricsHandler),
+
 		(r'/api/model/train', ModelTrainHandler),
 		(r'/api/model/config', ModelConfigHandler),
 		(r'/api/model/predict', ModelPredictHandler),
 		(r'/(.*)', tornado.web.StaticFileHandler, dict(path='./client', default_filename='index.html'))
 	])
 
-	try:
-		# spawn server processes
-		server = tornado.httpserver.HTTPServer(app, max_buffer_size=1024 ** 100)
-		server.bind(tornado.options.options.port)
-		server.start(tornado.options.options.np)
-
+	def connect():
 		# connect to database
 		if tornado.options.options.backend == 'file':
-			app.settings['db'] = backend.FileBackend(os.path.join(env.BASE_DIR['workspace'], tornado.options.options.url_file))
+			return backend.FileBackend(
+				os.path.join(env.BASE_DIR['workspace'], tornado.options.options.url_file),
+				journal=tornado.options.options.file_journal,
+				compact_every=tornado.options.options.file_compact_every,
+				batch_window=tornado.options.options.file_batch_window / 1000,
+				batch_size=tornado.options.options.file_batch_size)
+
+		elif tornado.options.options.backend == 'sqlite':
+			return backend.SqliteBackend(os.path.join(env.BASE_DIR['workspace'], tornado.options.options.url_sqlite))
 
 		elif tornado.options.options.backend == 'mongo':
-			app.settings['db'] = backend.MongoBackend(tornado.options.options.url_mongo)
+			return backend.MongoBackend(tornado.options.options.url_mongo)
 
 		else:
-			raise KeyError('Backend must be either \'json\' or \'mongo\'')
+			raise KeyError('Backend must be either \'file\', \'sqlite\' or \'mongo\'')
+
+	try:
+		# prepare the database once before spawning the server processes, so the data built
+		# from the saved tasks is complete before any process receives new tasks; the event
+		# loop of this process is closed before the fork, as required by tornado
+		db = connect()
+		asyncio.run(db.startup())
+		db.close()
+
+		# cancel the uploads abandoned while the server was stopped
+		for id in os.listdir(env.DATASETS_DIR):
+			upload.UploadSession.expire(os.path.join(env.DATASETS_DIR, id), env.UPLOAD_EXPIRE_SECONDS)
+
+		# spawn server processes; the request bodies held in memory, such as task batches and
+		# archives, aren't limited, while the dataset uploads limit their own streamed bodies
+		server = tornado.httpserver.HTTPServer(app, max_buffer_size=1024 ** 100)
+		server.bind(tornado.options.options.port)
+		server.start(tornado.options.options.np)
 
-		# initialize the admin and guest users
-		db = app.settings['db']
+		# connect each server process to the database and initialize the admin and guest users
+		app.settings['db'] = db = connect()
 		tornado.ioloop.IOLoop.current().run_sync(lambda: initialize_users(db))
 
 		# start the event loop
@@ -0,0 +1,191 @@
+import math
+
+
+
+# resource fields of the nextflow trace summarized for each process
+METRICS = ['realtime', '%cpu', 'peak_rss', 'read_bytes', 'write_bytes']
+
+# quantiles reported by the summaries
+QUANTILES = [0.5, 0.9, 0.99]
+
+# relative accuracy of the quantile sketches: values are counted in logarithmic
+# buckets whose bounds grow by GAMMA, so any quantile is estimated within 1%
+ACCURACY = 0.01
+GAMMA = (1 + ACCURACY) / (1 - ACCURACY)
+
+# bucket of the values that have no logarithm
+ZERO_BUCKET = 'zero'
+
+
+
+def trace_values(trace):
+	# get the numeric resource fields of a trace, missing or invalid ones are skipped
+	values = {}
+
+	for metric in METRICS:
+		value = trace.get(metric)
+
+		if isinstance(value, bool):
+			continue
+
+		try:
+			value = float(value)
+		except (TypeError, ValueError):
+			continue
+
+		if math.isfinite(value):
+			values[metric] = value
+
+	return values
+
+
+
+def bucket(value):
+	# bucket keys are strings so they can be used as field names in mongo
+	if value <= 0:
+		return ZERO_BUCKET
+
+	return str(math.ceil(math.log(value, GAMMA)))
+
+
+
+def bucket_value(key):
+	# estimate the values of a bucket by the middle of its bounds
+	if key == ZERO_BUCKET:
+		return 0.0
+
+	return 2 * GAMMA ** int(key) / (GAMMA + 1)
+
+
+
+def add(entry, values):
+	# add the resource values of a task to the running aggregates of its process,
+	# the mean and the sum of squared deviations (m2) are updated as in Welford's
+	# algorithm, so the variance of large values doesn't cancel out
+	for metric, value in values.items():
+		m = entry.setdefault(metric, {'count': 0, 'mean': 0.0, 'm2': 0.0, 'min': None, 'max': None, 'buckets': {}})
+		m['count'] += 1
+		delta = value - m['mean']
+		m['mean'] += delta / m['count']
+		m['m2'] += delta * (value - m['mean'])
+		m['min'] = value if m['min'] == None else min(m['min'], value)
+		m['max'] = value if m['max'] == None else max(m['max'], value)
+
+		key = bucket(value)
+		m['buckets'][key] = m['buckets'].get(key, 0) + 1
+
+
+
+def remove(entry, values):
+	# remove the resource values of a task by reverting add()
+	for metric, value in values.items():
+		m = entry[metric]
+		m['count'] -= 1
+
+		key = bucket(value)
+		m['buckets'][key] -= 1
+		if m['buckets'][key] == 0:
+			del m['buckets'][key]
+
+		if m['count'] == 0:
+			del entry[metric]
+			continue
+
+		delta = value - m['mean']
+		m['mean'] -= delta / m['count']
+		m['m2'] = max(m['m2'] - delta * (value - m['mean']), 0.0)
+
+		# the exact extremes of the remaining values aren't kept, so a removed extreme
+		# is replaced by the estimate of the lowest or highest bucket left, within the
+		# accuracy of the sketch
+		keys = sorted(m['buckets'], key=bucket_value)
+		if value <= m['min']:
+			m['min'] = min(max(bucket_value(keys[0]), m['min']), m['max'])
+		if value >= m['max']:
+			m['max'] = max(min(bucket_value(keys[-1]), m['max']), m['min'])
+
+
+
+def merge(entry, other):
+	# add the aggregates of other to the ones of entry, as if its values were added one by one
+	for metric, o in other.items():
+		m = entry.setdefault(metric, {'count': 0, 'mean': 0.0, 'm2': 0.0, 'min': None, 'max': None, 'buckets': {}})
+		count = m['count'] + o['count']
+		delta = o['mean'] - m['mean']
+		m['mean'] += delta * o['count'] / count
+		m['m2'] += o['m2'] + delta * delta * m['count'] * o['count'] / count
+		m['count'] = count
+		m['min'] = o['min'] if m['min'] == None else min(m['min'], o['min'])
+		m['max'] = o['max'] if m['max'] == None else max(m['max'], o['max'])
+
+		for key, n in o['buckets'].items():
+			m['buckets'][key] = m['buckets'].get(key, 0) + n
+
+
+
+def mongo_update(entry):
+	# express merge() as a pipeline update of a document with the aggregates under 'metrics',
+	# so the updates of the same process made by several server processes are combined
+	fields = {}
+
+	for metric, m in entry.items():
+		prefix = 'metrics.%s.' % (metric)
+
+		def field(name):
+			return {'$ifNull': ['$' + prefix + name, 0]}
+
+		count = {'$add': [field('count'), m['count']]}
+		delta = {'$subtract': [m['mean'], field('mean')]}
+
+		# the fields only depend on the ones listed after them, so the result is the
+		# same whether the stage sees the previous values or updates them in turn
+		fields[prefix + 'm2'] = {'$add': [field('m2'), m['m2'], {'$divide': [{'$multiply': [delta, delta, field('count'), m['count']]}, count]}]}
+		fields[prefix + 'mean'] = {'$add': [field('mean'), {'$divide': [{'$multiply': [delta, m['count']]}, count]}]}
+		fields[prefix + 'count'] = count
+		fields[prefix + 'min'] = {'$min': ['$' + prefix + 'min', m['min']]}
+		fields[prefix + 'max'] = {'$max': ['$' + prefix + 'max', m['max']]}
+
+		for key, n in m['buckets'].items():
+			fields[prefix + 'buckets.' + key] = {'$add': [field('buckets.' + key), n]}
+
+	return [{'$set': fields}] if fields else []
+
+
+
+def quantile(m, q):
+	# find the bucket of the value of nearest rank ceil(q * count), so the high quantiles
+	# of small samples reach the largest value (rounded, since 0.9 * 10 > 9 in floating point)
+	rank = max(math.ceil(round(q * m['count'], 9)), 1)
+	keys = sorted(m['buckets'], key=bucket_value)
+	n = 0
+
+	for key in keys:
+		n += m['buckets'][key]
+		if n >= rank:
+			break
+
+	return min(max(bucket_value(key), m['min']), m['max'])
+
+
+
+def summary(entry):
+	# compute the count, mean, variance, min, max and quantiles of each resource field
+	result = {}
+
+	for metric, m in entry.items():
+		if m['count'] <= 0:
+			continue
+
+		variance = max(m['m2'] / m['count'], 0.0)
+
+		result[metric] = {
+			'count': m['count'],
+			'mean': m['mean'],
+			'variance': variance,
+			'std': math.sqrt(variance),
+			'min': m['min'],
+			'max': m['max'],
+			**{'p%g' % (q * 100): quantile(m, q) for q in QUANTILES}
+		}
+
+	return result
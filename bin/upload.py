@@ -0,0 +1,318 @@
+import contextlib
+import email.message
+import fcntl
+import hashlib
+import itertools
+import json
+import os
+import time
+
+
+
+def target_path(dataset_dir, format, parameter, filename):
+	# keep the filename in the 'directory-path' subdirectory, or rename it after the 'file-path' parameter
+	if format == 'directory-path':
+		return os.path.join(dataset_dir, parameter, os.path.basename(filename))
+	else:
+		return os.path.join(dataset_dir, parameter + os.path.splitext(os.path.basename(filename))[1])
+
+
+
+def parse_header(value):
+	# split a header such as 'form-data; name="body"; filename="a.raw"' into its value and parameters
+	msg = email.message.Message()
+	msg['content-type'] = value
+	params = msg.get_params() or [(value, '')]
+
+	return params[0][0].lower(), {k.lower(): v for k, v in params[1:]}
+
+
+
+class MultipartParser():
+
+	# incremental parser of a multipart/form-data body: the body is fed in
+	# chunks as it is received and the content of each part is passed to
+	# the file returned by open_part(name, filename), or discarded if it
+	# returns None, so the whole body is never held in memory
+
+	def __init__(self, boundary, open_part, max_header_size=64 * 1024):
+		self._delimiter = b'--' + boundary
+		self._open_part = open_part
+		self._max_header_size = max_header_size
+		self._buffer = b''
+		self._state = 'preamble'
+		self._part = None
+
+	def feed(self, data):
+		self._buffer += data
+
+		while True:
+			if self._state == 'preamble':
+				# skip everything before the first delimiter
+				i = self._buffer.find(self._delimiter)
+				if i < 0:
+					self._buffer = self._buffer[-len(self._delimiter):]
+					return
+
+				self._buffer = self._buffer[i + len(self._delimiter):]
+				self._state = 'delimiter'
+
+			elif self._state == 'delimiter':
+				# a delimiter is followed by CRLF and a new part, or by '--' at the end of the body
+				if len(self._buffer) < 2:
+					return
+
+				if self._buffer.startswith(b'--'):
+					self._buffer = b''
+					self._state = 'end'
+					return
+
+				self._buffer = self._buffer.lstrip(b' \t')
+				if len(self._buffer) < 2:
+					return
+
+				if not self._buffer.startswith(b'\r\n'):
+					raise ValueError('Invalid multipart delimiter')
+
+				self._buffer = self._buffer[2:]
+				self._state = 'headers'
+
+			elif self._state == 'headers':
+				# read the headers of the part up to the empty line
+				i = self._buffer.find(b'\r\n\r\n')
+				if i < 0:
+					if len(self._buffer) > self._max_header_size:
+						raise ValueError('Multipart headers are too long')
+					return
+
+				headers = {}
+				for line in self._buffer[:i].decode('utf-8').split('\r\n'):
+					if ':' in line:
+						key, value = line.split(':', 1)
+						headers[key.strip().lower()] = value.strip()
+
+				self._buffer = self._buffer[i + 4:]
+
+				disposition, params = parse_header(headers.get('content-disposition', ''))
+				if disposition != 'form-data' or 'name' not in params:
+					raise ValueError('Invalid multipart part')
+
+				self._part = self._open_part(params['name'], params.get('filename'))
+				self._state = 'body'
+
+			elif self._state == 'body':
+				# write the content of the part up to the next delimiter, keeping
+				# the bytes that may be the beginning of a delimiter split between chunks
+				i = self._buffer.find(b'\r\n' + self._delimiter)
+				if i < 0:
+					n = max(len(self._buffer) - len(self._delimiter) - 1, 0)
+					self._write(self._buffer[:n])
+					self._buffer = self._buffer[n:]
+					return
+
+				self._write(self._buffer[:i])
+				self._buffer = self._buffer[i + 2 + len(self._delimiter):]
+				self._part = None
+				self._state = 'delimiter'
+
+			else:
+				# ignore the epilogue
+				self._buffer = b''
+				return
+
+	def _write(self, data):
+		if data and self._part != None:
+			self._part.write(data)
+
+	def close(self):
+		# make sure the body ended with the final delimiter
+		if self._state != 'end':
+			raise ValueError('Incomplete multipart body')
+
+
+
+class FileSink():
+
+	# file written under a temporary name next to its destination, and
+	# renamed when the upload is complete so a partial file is never used;
+	# the temporary name is unique to each sink, so concurrent uploads of
+	# the same file don't write into each other
+
+	_counter = itertools.count()
+
+	def __init__(self, path):
+		self.path = path
+		self.size = 0
+		self._tmp_path = os.path.join(os.path.dirname(path), '.%s.%d.%d.part' % (os.path.basename(path), os.getpid(), next(self._counter)))
+		self._file = open(self._tmp_path, 'xb')
+
+	def write(self, data):
+		self._file.write(data)
+		self.size += len(data)
+
+	def commit(self):
+		self._file.close()
+		os.replace(self._tmp_path, self.path)
+
+	def abort(self):
+		self._file.close()
+		if os.path.exists(self._tmp_path):
+			os.remove(self._tmp_path)
+
+
+
+class UploadSession():
+
+	# resumable upload of a single file: the received data is appended to
+	# '.uploads/<id>.data' in the dataset directory and its state is kept in
+	# '.uploads/<id>.json', so an interrupted upload continues from the size
+	# of the data file, which is the committed offset
+
+	FORMATS = ['directory-path', 'file-path']
+
+	def __init__(self, dataset_dir, state):
+		self.dataset_dir = dataset_dir
+		self.state = state
+		self.id = state['_id']
+		self.data_path = os.path.join(dataset_dir, '.uploads', '%s.data' % self.id)
+		self.state_path = os.path.join(dataset_dir, '.uploads', '%s.json' % self.id)
+		self._file = None
+
+	@classmethod
+	def create(cls, dataset_dir, id, format, parameter, filename, size, user_id):
+		if format not in cls.FORMATS:
+			raise ValueError('Invalid format "%s"' % format)
+
+		if not isinstance(filename, str) or not os.path.basename(filename):
+			raise ValueError('Invalid filename')
+
+		if size != None and (not isinstance(size, int) or size < 0):
+			raise ValueError('Invalid size')
+
+		session = cls(dataset_dir, {
+			'_id': id,
+			'format': format,
+			'parameter': parameter,
+			'filename': os.path.basename(filename),
+			'size': size,
+			'user_id': user_id,
+			'date_created': int(time.time() * 1000)
+		})
+
+		os.makedirs(os.path.dirname(session.state_path), exist_ok=True)
+		open(session.data_path, 'wb').close()
+
+		# write the state last, so a session without state is never used
+		tmp_path = session.state_path + '.tmp'
+		with open(tmp_path, 'w') as f:
+			json.dump(session.state, f)
+		os.replace(tmp_path, session.state_path)
+
+		return session
+
+	@classmethod
+	def load(cls, dataset_dir, id):
+		try:
+			with open(os.path.join(dataset_dir, '.uploads', '%s.json' % id)) as f:
+				return cls(dataset_dir, json.load(f))
+		except FileNotFoundError:
+			raise IndexError('Upload was not found')
+
+	@property
+	def offset(self):
+		try:
+			return os.path.getsize(self.data_path)
+		except FileNotFoundError:
+			raise IndexError('Upload was not found')
+
+	def status(self):
+		return {**self.state, 'offset': self.offset}
+
+	def open(self, offset=None):
+		# open the data file to append the data sent from the given offset; the lock
+		# makes sure a single request writes, finalizes or cancels the session across
+		# server processes, and is released when the file is closed
+		try:
+			f = os.fdopen(os.open(self.data_path, os.O_WRONLY | os.O_APPEND), 'ab')
+		except FileNotFoundError:
+			raise IndexError('Upload was not found')
+
+		try:
+			fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+		except BlockingIOError:
+			f.close()
+			raise ValueError('Upload is in progress')
+
+		# the session may have been finalized or canceled before the lock was taken,
+		# in which case the file is either gone or already moved to the dataset
+		if not os.path.exists(self.state_path):
+			f.close()
+			raise IndexError('Upload was not found')
+
+		if offset != None and f.tell() != offset:
+			size = f.tell()
+			f.close()
+			raise ValueError('Offset %d doesn\'t match the upload offset %d' % (offset, size))
+
+		self._file = f
+		return f
+
+	@contextlib.contextmanager
+	def _locked(self):
+		# use the lock of the data file already opened by this session, or take it for the operation
+		if self._file != None and not self._file.closed:
+			yield
+		else:
+			with self.open():
+				yield
+
+	def checksum(self, algorithm):
+		# hash the data file in blocks
+		h = hashlib.new(algorithm)
+		with open(self.data_path, 'rb') as f:
+			for block in iter(lambda: f.read(1024 ** 2), b''):
+				h.update(block)
+
+		return h.hexdigest()
+
+	def commit(self):
+		# move the data file to its destination in the dataset and forget the session
+		path = target_path(self.dataset_dir, self.state['format'], self.state['parameter'], self.state['filename'])
+		os.makedirs(os.path.dirname(path), exist_ok=True)
+
+		with self._locked():
+			os.replace(self.data_path, path)
+			os.remove(self.state_path)
+
+		return path
+
+	def delete(self):
+		with self._locked():
+			os.remove(self.state_path)
+			os.remove(self.data_path)
+
+	@classmethod
+	def expire(cls, dataset_dir, max_age):
+		# cancel the uploads of the dataset whose files weren't written for max_age
+		# seconds, and remove the files left behind by an interrupted session
+		uploads_dir = os.path.join(dataset_dir, '.uploads')
+		if not os.path.isdir(uploads_dir):
+			return
+
+		files = {}
+		for name in os.listdir(uploads_dir):
+			files.setdefault(name.split('.')[0], []).append(name)
+
+		for id, names in files.items():
+			try:
+				if any(time.time() - os.path.getmtime(os.path.join(uploads_dir, name)) < max_age for name in names):
+					continue
+
+				if '%s.json' % id in names and '%s.data' % id in names:
+					cls.load(dataset_dir, id).delete()
+				else:
+					for name in names:
+						os.remove(os.path.join(uploads_dir, name))
+			except (FileNotFoundError, IndexError, ValueError):
+				# the upload was removed or resumed meanwhile
+				continue
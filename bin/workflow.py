@@ -114,7 +114,10 @@ async def set_property(db, workflow, key, value):
 	n_attempt = int(workflow['n_attempts'] - 1)
 	if key in workflow['attempts'][n_attempt]:
 		workflow['attempts'][n_attempt][key] = value
-	await db.workflow_update(workflow['_id'], workflow)
+		# update the workflow and its last attempt at once
+		await db.attempt_set_fields(workflow['_id'], n_attempt, {key: value}, workflow_fields={key: value})
+	else:
+		await db.workflow_set_fields(workflow['_id'], {key: value})
 
 
 
@@ -0,0 +1,141 @@
+#!/bin/bash
+# Upload a large file for a dataset instance on a nextflow server in chunks.
+# If the upload is interrupted, running the script again continues it from the last chunk received.
+
+# parse command-line arguments
+if [[ $# != 6 && $# != 7 ]]; then
+	echo "usage: $0 <url> <token_file> <id_file> <format> <parameter> <filename> [chunk_size_mb]"
+	exit -1
+fi
+
+URL="$1"
+TOKEN_FILE="$2"
+ID_FILE="$3"
+FORMAT="$4"
+PARAMETER="$5"
+FILENAME="$6"
+CHUNK_SIZE=$(( ${7:-64} * 1024 * 1024 ))
+MAX_RETRIES=10
+
+
+
+# read the token from the file
+if [[ ! -f "${TOKEN_FILE}" ]]; then
+	echo "Token file not found: ${TOKEN_FILE}"
+	exit -1
+fi
+TOKEN=$(cat "${TOKEN_FILE}")
+
+
+
+# read the id from the file
+if [[ ! -f "${ID_FILE}" ]]; then
+	echo "Id file not found: ${ID_FILE}"
+	exit -1
+fi
+ID=$(cat "${ID_FILE}")
+
+
+
+# check the file to upload
+if [[ ! -f "${FILENAME}" ]]; then
+	echo "File not found: ${FILENAME}"
+	exit -1
+fi
+SIZE=$(wc -c < "${FILENAME}" | tr -d ' ')
+
+
+
+# get the offset of an upload from the response headers, empty if the upload doesn't exist
+get_offset() {
+	curl -s -D - -o /dev/null \
+		-H "Authorization: Bearer ${TOKEN}" \
+		${URL}/api/datasets/${ID}/uploads/$1 \
+		| tr -d '\r' | sed -n 's/^[Uu]pload-[Oo]ffset:[[:space:]]*\([0-9]*\).*/\1/p'
+}
+
+
+
+# continue the upload saved in the state file, or create a new one; the state file
+# is named after the dataset, format, parameter and file, so the uploads of the same
+# file to another dataset or parameter don't continue each other
+STATE_FILE="${ID}.${FORMAT}.${PARAMETER}.$(basename "${FILENAME}").upload"
+UPLOAD_ID=""
+OFFSET=""
+
+if [[ -f "${STATE_FILE}" ]]; then
+	UPLOAD_ID=$(cat "${STATE_FILE}")
+	OFFSET=$(get_offset "${UPLOAD_ID}")
+fi
+
+if [[ ${OFFSET} == "" ]]; then
+	OUTPUT=$(curl -s \
+		-X POST \
+		-H "Content-Type: application/json" \
+		-H "Authorization: Bearer ${TOKEN}" \
+		-d "{\"filename\": \"$(basename "${FILENAME}")\", \"size\": ${SIZE}}" \
+		${URL}/api/datasets/${ID}/${FORMAT}/${PARAMETER}/uploads)
+
+	UPLOAD_ID=$(echo "$OUTPUT" | sed -n 's/.*"_id"[[:space:]]*:[[:space:]]*"\([^"]*\)".*/\1/p')
+
+	if [[ ${UPLOAD_ID} == "" ]]; then
+		echo "Upload failed. Please check your parameters. Error: ${OUTPUT}"
+		exit -1
+	fi
+
+	echo "${UPLOAD_ID}" > "${STATE_FILE}"
+	OFFSET=0
+fi
+
+
+
+# send the chunks from the offset received by the server
+RETRIES=0
+
+while [[ ${OFFSET} -lt ${SIZE} ]]; do
+	echo "uploading ${FILENAME}: ${OFFSET} of ${SIZE} bytes"
+
+	tail -c +$(( OFFSET + 1 )) "${FILENAME}" | head -c ${CHUNK_SIZE} | curl -s -o /dev/null \
+		-X PUT \
+		-H "Content-Type: application/octet-stream" \
+		-H "Authorization: Bearer ${TOKEN}" \
+		-H "Upload-Offset: ${OFFSET}" \
+		--data-binary @- \
+		${URL}/api/datasets/${ID}/uploads/${UPLOAD_ID}
+
+	# ask the server which bytes were received, and retry after a failure
+	NEW_OFFSET=$(get_offset "${UPLOAD_ID}")
+
+	if [[ ${NEW_OFFSET} == "" || ${NEW_OFFSET} -le ${OFFSET} ]]; then
+		RETRIES=$(( RETRIES + 1 ))
+		if [[ ${RETRIES} -gt ${MAX_RETRIES} ]]; then
+			echo "Upload failed after ${MAX_RETRIES} retries. Run the script again to continue it."
+			exit -1
+		fi
+		sleep ${RETRIES}
+	else
+		RETRIES=0
+	fi
+
+	OFFSET=${NEW_OFFSET:-${OFFSET}}
+done
+
+
+
+# finalize the upload with the checksum of the file
+CHECKSUM=$(sha256sum "${FILENAME}" | cut -d ' ' -f 1)
+
+OUTPUT=$(curl -s \
+	-X POST \
+	-H "Content-Type: application/json" \
+	-H "Authorization: Bearer ${TOKEN}" \
+	-d "{\"checksum\": \"sha256:${CHECKSUM}\"}" \
+	${URL}/api/datasets/${ID}/uploads/${UPLOAD_ID}/finalize)
+
+echo "${OUTPUT}"
+
+if [[ ${OUTPUT} == *'"status": 200'* ]]; then
+	rm -f "${STATE_FILE}"
+else
+	exit -1
+fi
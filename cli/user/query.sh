@@ -2,13 +2,14 @@
 # List all user instances on a nextflow server.
 
 # parse command-line arguments
-if [[ $# != 2 ]]; then
-    echo "usage: $0 <url> <token_file>"
+if [[ $# != 2 && $# != 3 ]]; then
+    echo "usage: $0 <url> <token_file> [cursor]"
     exit -1
 fi
 
 URL="$1"
 TOKEN_FILE="$2"
+CURSOR="$3"
 
 
 # read the token from the file
@@ -20,9 +21,14 @@ TOKEN=$(cat "${TOKEN_FILE}")
 
 
 # list all user instances
+# (pass the printed cursor to list the next page)
+HEADERS=$(mktemp)
 curl -s \
 	-X GET \
+	-D "${HEADERS}" \
 	-H "Authorization: Bearer ${TOKEN}" \
-	${URL}/api/users
+	"${URL}/api/users?cursor=${CURSOR}"
 
 echo
+grep -i '^x-next-cursor:' "${HEADERS}" | sed 's/^[^:]*: */next cursor: /' | tr -d '\r'
+rm -f "${HEADERS}"
@@ -5,7 +5,7 @@ IMAGE_NAME="bentsherman/nextflow-api"
 set -ex
 
 # remove data files
-rm -rf _models _trace _workflows .nextflow* db.json db.pkl
+rm -rf _models _trace _workflows .nextflow* db.json db.pkl db.*.pkl* db.sqlite*
 
 # build docker image
 docker build -t ${IMAGE_NAME} .
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# the server modules are imported from bin/, as when the server is run from there
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'bin'))
@@ -0,0 +1,46 @@
+import base64
+import json
+
+import pytest
+
+import backend
+
+
+
+def test_cursor_round_trip():
+	for order_key, value in [('date_created', 1700000000000), ('utcTime', '2024-01-01T00:00:00Z')]:
+		cursor = backend.encode_cursor({'_id': 'abc', order_key: value, 'name': 'x'}, order_key)
+
+		assert isinstance(cursor, str)
+		assert backend.decode_cursor(cursor, order_key) == (value, 'abc')
+
+
+
+def test_cursor_is_url_safe():
+	cursor = backend.encode_cursor({'_id': '>>>???', 'utcTime': '???>>>'}, 'utcTime')
+
+	assert '+' not in cursor and '/' not in cursor
+
+
+
+@pytest.mark.parametrize('cursor', [
+	'',
+	'not base64!',
+	base64.urlsafe_b64encode(b'not json').decode(),
+	base64.urlsafe_b64encode(json.dumps([1]).encode()).decode(),
+	base64.urlsafe_b64encode(json.dumps([1, 2]).encode()).decode(),
+	base64.urlsafe_b64encode(json.dumps([True, 'abc']).encode()).decode(),
+	base64.urlsafe_b64encode(json.dumps({'a': 1}).encode()).decode()
+])
+def test_invalid_cursor(cursor):
+	with pytest.raises(ValueError):
+		backend.decode_cursor(cursor, 'date_created')
+
+
+
+def test_cursor_of_another_order_key():
+	# a cursor of the tasks, sorted by time, can't be used to page the users
+	cursor = backend.encode_cursor({'_id': 'abc', 'utcTime': '2024-01-01T00:00:00Z'}, 'utcTime')
+
+	with pytest.raises(ValueError):
+		backend.decode_cursor(cursor, 'date_created')
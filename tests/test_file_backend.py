@@ -0,0 +1,74 @@
+import asyncio
+import os
+import pickle
+
+import backend
+
+
+
+def task(i, event='process_completed'):
+	return {'_id': 't%03d' % i, 'utcTime': '%03d' % i, 'event': event, 'runId': 'r1', 'runName': 'run'}
+
+
+
+def ids(db):
+	return sorted(t['_id'] for t in asyncio.run(db.task_query(0, 1000)))
+
+
+
+def test_journal_replay(tmp_path):
+	url = str(tmp_path / 'db.pkl')
+	db = backend.FileBackend(url, journal=True)
+
+	async def write():
+		await db.task_create_many([task(i) for i in range(5)])
+		await db.task_create(task(5))
+
+	asyncio.run(write())
+
+	# the writes are only in the journal until it is compacted
+	with open(url.replace('.pkl', '.tasks.pkl'), 'rb') as f:
+		assert pickle.load(f) == 0
+		assert pickle.load(f) == []
+
+	assert ids(backend.FileBackend(url, journal=True)) == ['t%03d' % i for i in range(6)]
+
+
+
+def test_journal_replay_after_compaction(tmp_path):
+	url = str(tmp_path / 'db.pkl')
+	db = backend.FileBackend(url, journal=True, compact_every=4)
+
+	async def write():
+		for i in range(10):
+			await db.task_create(task(i))
+
+	asyncio.run(write())
+
+	# the snapshot of the last compaction is combined with the journal written after it
+	assert ids(backend.FileBackend(url, journal=True)) == ['t%03d' % i for i in range(10)]
+	assert ids(db) == ['t%03d' % i for i in range(10)]
+
+
+
+def test_journal_replay_skips_partial_record(tmp_path):
+	url = str(tmp_path / 'db.pkl')
+	db = backend.FileBackend(url, journal=True)
+	asyncio.run(db.task_create(task(0)))
+
+	# simulate a crash in the middle of appending a mutation
+	with open(url.replace('.pkl', '.tasks.pkl.journal'), 'ab') as f:
+		f.write(pickle.dumps(('insert', None, task(1)))[:-5])
+
+	assert ids(backend.FileBackend(url, journal=True)) == ['t000']
+
+
+
+def test_journal_folded_without_journal(tmp_path):
+	url = str(tmp_path / 'db.pkl')
+	db = backend.FileBackend(url, journal=True)
+	asyncio.run(db.task_create_many([task(i) for i in range(3)]))
+
+	# opening the collection without journal folds the journal into the snapshot
+	assert ids(backend.FileBackend(url)) == ['t000', 't001', 't002']
+	assert not os.path.exists(url.replace('.pkl', '.tasks.pkl.journal'))
@@ -0,0 +1,122 @@
+import copy
+import random
+import statistics
+
+import pytest
+
+import stats
+
+
+
+def entry_of(values):
+	entry = {}
+	for v in values:
+		stats.add(entry, {'realtime': v})
+	return entry
+
+
+
+def test_add():
+	values = [3.0, 1.0, 4.0, 1.0, 5.0, 9.0, 2.0, 6.0]
+	m = entry_of(values)['realtime']
+
+	assert m['count'] == len(values)
+	assert m['mean'] == pytest.approx(statistics.mean(values))
+	assert m['m2'] / m['count'] == pytest.approx(statistics.pvariance(values))
+	assert (m['min'], m['max']) == (1.0, 9.0)
+	assert sum(m['buckets'].values()) == len(values)
+
+
+
+def test_variance_of_large_values():
+	# the variance doesn't cancel out when the values are far from zero
+	values = [1e12 + v for v in [4.0, 7.0, 13.0, 16.0]]
+	result = stats.summary(entry_of(values))['realtime']
+
+	assert result['variance'] == pytest.approx(22.5)
+
+
+
+def test_remove():
+	rng = random.Random(0)
+	values = [rng.uniform(1, 1000) for _ in range(100)]
+	entry = entry_of(values)
+
+	for v in values[50:]:
+		stats.remove(entry, {'realtime': v})
+
+	m = entry['realtime']
+	expected = entry_of(values[:50])['realtime']
+
+	assert m['count'] == 50
+	assert m['mean'] == pytest.approx(expected['mean'])
+	assert m['m2'] == pytest.approx(expected['m2'])
+	assert m['buckets'] == expected['buckets']
+
+	# the extremes are estimated within the accuracy of the buckets
+	assert m['min'] == pytest.approx(min(values[:50]), rel=2 * stats.ACCURACY)
+	assert m['max'] == pytest.approx(max(values[:50]), rel=2 * stats.ACCURACY)
+
+
+
+def test_remove_extreme():
+	entry = entry_of([10.0, 20.0, 1000.0])
+	stats.remove(entry, {'realtime': 1000.0})
+
+	assert entry['realtime']['max'] == pytest.approx(20.0, rel=2 * stats.ACCURACY)
+
+	# removing the last value removes the metric
+	stats.remove(entry, {'realtime': 10.0})
+	stats.remove(entry, {'realtime': 20.0})
+
+	assert entry == {}
+
+
+
+def test_merge():
+	values = [float(v) for v in range(1, 21)]
+	entry = entry_of(values[:7])
+	stats.merge(entry, entry_of(values[7:]))
+
+	m = entry['realtime']
+	expected = entry_of(values)['realtime']
+
+	assert m['count'] == expected['count']
+	assert m['mean'] == pytest.approx(expected['mean'])
+	assert m['m2'] == pytest.approx(expected['m2'])
+	assert (m['min'], m['max']) == (1.0, 20.0)
+	assert m['buckets'] == expected['buckets']
+
+
+
+def test_merge_into_empty():
+	other = entry_of([1.0, 2.0])
+	entry = {}
+	stats.merge(entry, copy.deepcopy(other))
+
+	assert entry == other
+
+
+
+@pytest.mark.parametrize('q, expected', [(0.5, 6.0), (0.9, 10.0), (0.99, 10.0), (0.0, 2.0)])
+def test_quantile_nearest_rank(q, expected):
+	m = entry_of([2.0, 4.0, 6.0, 8.0, 10.0])['realtime']
+
+	assert stats.quantile(m, q) == pytest.approx(expected, rel=stats.ACCURACY)
+
+
+
+def test_quantile_accuracy():
+	rng = random.Random(1)
+	values = sorted(rng.uniform(1, 1e6) for _ in range(1000))
+	m = entry_of(values)['realtime']
+
+	for q in stats.QUANTILES:
+		assert stats.quantile(m, q) == pytest.approx(values[int(q * len(values)) - 1], rel=stats.ACCURACY)
+
+
+
+def test_trace_values():
+	values = stats.trace_values({'realtime': '12', '%cpu': 'n/a', 'peak_rss': True, 'read_bytes': None, 'write_bytes': 3})
+
+	assert values == {'realtime': 12.0, 'write_bytes': 3.0}
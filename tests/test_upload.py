@@ -0,0 +1,104 @@
+import io
+
+import pytest
+
+import upload
+
+
+
+BOUNDARY = b'----boundary1234'
+
+
+
+def body(parts):
+	data = b'preamble\r\n'
+	for name, filename, content in parts:
+		disposition = 'form-data; name="%s"' % name + ('; filename="%s"' % filename if filename else '')
+		data += b'--' + BOUNDARY + b'\r\nContent-Disposition: ' + disposition.encode() + b'\r\n\r\n' + content + b'\r\n'
+
+	return data + b'--' + BOUNDARY + b'--\r\nepilogue'
+
+
+
+def parse(data, chunk_sizes):
+	parts = []
+
+	def open_part(name, filename):
+		f = io.BytesIO()
+		parts.append((name, filename, f))
+		return f
+
+	parser = upload.MultipartParser(BOUNDARY, open_part)
+
+	# feed the body in chunks of the given sizes, repeated up to its end
+	i = 0
+	while i < len(data):
+		for n in chunk_sizes:
+			parser.feed(data[i:i + n])
+			i += n
+
+	parser.close()
+
+	return [(name, filename, f.getvalue()) for name, filename, f in parts]
+
+
+
+PARTS = [
+	('body', None, b'{"a": 1}'),
+	('file', 'a.raw', b'\r\n--' + BOUNDARY[:-1] + b' is not the boundary\r\n' * 100),
+	('file', 'empty.txt', b'')
+]
+
+
+
+@pytest.mark.parametrize('chunk_sizes', [[1], [2], [7], [64], [1 << 20], [5, 1, 13]])
+def test_chunks(chunk_sizes):
+	assert parse(body(PARTS), chunk_sizes) == PARTS
+
+
+
+def test_boundary_split_at_every_position():
+	data = body(PARTS)
+
+	# split the body once at every position, including inside each delimiter
+	for i in range(len(data)):
+		assert parse(data, [i, len(data)]) == PARTS
+
+
+
+def test_discarded_parts():
+	names = []
+
+	def open_part(name, filename):
+		names.append(name)
+		return None
+
+	parser = upload.MultipartParser(BOUNDARY, open_part)
+	parser.feed(body(PARTS))
+	parser.close()
+
+	assert names == ['body', 'file', 'file']
+
+
+
+def test_incomplete_body():
+	data = body(PARTS)
+
+	with pytest.raises(ValueError):
+		parse(data[:data.rindex(b'--' + BOUNDARY)], [64])
+
+
+
+def test_invalid_part():
+	data = b'--' + BOUNDARY + b'\r\nContent-Type: text/plain\r\n\r\nx\r\n--' + BOUNDARY + b'--'
+
+	with pytest.raises(ValueError):
+		parse(data, [64])
+
+
+
+def test_headers_too_long():
+	parser = upload.MultipartParser(BOUNDARY, lambda name, filename: None, max_header_size=16)
+
+	with pytest.raises(ValueError):
+		parser.feed(b'--' + BOUNDARY + b'\r\nContent-Disposition: form-data; name="body"')